@@ -0,0 +1,78 @@
+import numpy as np
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QImage, QPainter, QPixmap
+from PySide6.QtWidgets import QGraphicsScene
+
+from Models.Tiling import row_bands, run_tiles
+
+FORMATS = {1: QImage.Format_Grayscale8, 3: QImage.Format_RGB888, 4: QImage.Format_RGBA8888}
+
+
+def to_display(image):
+    # float [0, 1] -> contiguous uint8 frame, converted band by band so no full size float temporary is made
+    if image.dtype == np.uint8:
+        return np.ascontiguousarray(image)
+
+    frame = np.empty(image.shape, dtype=np.uint8)
+
+    def band(tile):
+        r0, r1 = tile
+        frame[r0:r1] = np.clip(image[r0:r1], 0, 1) * 255
+
+    run_tiles(band, row_bands(image.shape[0], frame[:1].size))
+    return frame
+
+
+def to_qimage(frame):
+    # wraps the frame's memory without copying, the frame has to outlive the QImage
+    m, n = frame.shape[:2]
+    channels = 1 if frame.ndim == 2 else frame.shape[2]
+    return QImage(frame.data, n, m, frame.strides[0], FORMATS[channels])
+
+
+def to_pixmap(image):
+    return QPixmap.fromImage(to_qimage(to_display(image)))
+
+
+class ImageView:
+    # one scene and pixmap item per view, new frames only replace the item's pixmap
+    def __init__(self, graphicsView):
+        self.view = graphicsView
+        self.scene = QGraphicsScene()
+        self.item = self.scene.addPixmap(QPixmap())
+        # the frame the pixmap shows, None after show_pixmap
+        self.frame = None
+
+    def show(self, frame):
+        self.show_pixmap(QPixmap.fromImage(to_qimage(frame)))
+        self.frame = frame
+
+    def patch(self, frame, window):
+        # frame differs from the one shown only inside the (r0, r1, c0, c1) window, only that part is uploaded
+        r0, r1, c0, c1 = window
+        pixmap = self.item.pixmap()
+        # without the item's reference, painting does not detach a copy of the whole pixmap
+        self.item.setPixmap(QPixmap())
+        if r1 > r0 and c1 > c0:
+            block = np.ascontiguousarray(frame[r0:r1, c0:c1])
+            painter = QPainter(pixmap)
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.drawImage(c0, r0, to_qimage(block))
+            painter.end()
+        self.item.setPixmap(pixmap)
+        self.frame = frame
+
+    def show_pixmap(self, pixmap):
+        if self.view.scene() is not self.scene:
+            self.view.setScene(self.scene)
+        resized = pixmap.size() != self.item.pixmap().size()
+        self.item.setPixmap(pixmap)
+        if resized:
+            self.scene.setSceneRect(self.item.boundingRect())
+        self.view.fitInView(self.item, Qt.KeepAspectRatio)
+        self.frame = None
+
+    def clear(self):
+        self.view.setScene(None)
+        self.item.setPixmap(QPixmap())
+        self.frame = None
@@ -0,0 +1,78 @@
+import sys
+import traceback
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+from PySide6.QtWidgets import QComboBox, QDialog, QDialogButtonBox, QDoubleSpinBox, QFormLayout, QSpinBox
+
+from Models.Animation import Export_Animation, sweep_values
+from Models.Cancellation import CancelToken, Cancelled
+
+
+class ExportDialog(QDialog):
+    # asks which parameter of the effect to sweep, over which range and how many frames
+    def __init__(self, parent, parameters):
+        super(ExportDialog, self).__init__(parent)
+        self.setWindowTitle("Export Animation")
+        self.parameters = parameters
+
+        self.parameter_box = QComboBox()
+        self.parameter_box.addItems(list(parameters))
+        self.start_box, self.stop_box = QDoubleSpinBox(), QDoubleSpinBox()
+        for box in (self.start_box, self.stop_box):
+            box.setRange(-100000, 100000)
+            box.setDecimals(2)
+        self.frames_box = QSpinBox()
+        self.frames_box.setRange(2, 10000)
+        self.frames_box.setValue(30)
+        self.fps_box = QSpinBox()
+        self.fps_box.setRange(1, 120)
+        self.fps_box.setValue(20)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QFormLayout(self)
+        layout.addRow("Parameter", self.parameter_box)
+        layout.addRow("From", self.start_box)
+        layout.addRow("To", self.stop_box)
+        layout.addRow("Frames", self.frames_box)
+        layout.addRow("Frames per second", self.fps_box)
+        layout.addRow(buttons)
+
+        self.parameter_box.currentTextChanged.connect(self.parameter_changed)
+        self.parameter_changed(self.parameter_box.currentText())
+
+    def parameter_changed(self, name):
+        # the sweep starts at the current value of the parameter
+        self.start_box.setValue(self.parameters[name])
+        self.stop_box.setValue(self.parameters[name])
+
+    def sweep(self):
+        return (self.parameter_box.currentText(),
+                sweep_values(self.start_box.value(), self.stop_box.value(), self.frames_box.value()),
+                self.fps_box.value())
+
+
+class ExportSignals(QObject):
+    progress = Signal(int, int)
+    finished = Signal(str)
+
+
+class ExportJob(QRunnable):
+    def __init__(self, image, effect_name, parameters, parameter_name, values, file_name, fps):
+        super(ExportJob, self).__init__()
+        self.signals = ExportSignals()
+        self.token = CancelToken()
+        self.job = (image, effect_name, dict(parameters), parameter_name, values, file_name, fps)
+
+    def run(self):
+        try:
+            count = Export_Animation(*self.job, token=self.token,
+                                     progress=lambda i, total: self.signals.progress.emit(i, total))
+            self.signals.finished.emit("Exported %d frames to %s" % (count, self.job[5]))
+        except Cancelled:
+            self.signals.finished.emit("Export cancelled")
+        except Exception as e:
+            traceback.print_exception(*sys.exc_info())
+            self.signals.finished.emit("Export failed: %s" % e)
@@ -1,30 +1,37 @@
-import imageio
-import numpy as np
+import os
+import shutil
+import tempfile
 import traceback
-from PIL import ImageQt, Image
 from PySide6.QtCore import QThreadPool, Qt, Slot
-from PySide6.QtGui import QIcon, QPixmap, QImageReader
+from PySide6.QtGui import QIcon, QPixmap, QKeySequence, QShortcut
 from PySide6.QtUiTools import QUiLoader
-from PySide6.QtWidgets import QApplication, QGraphicsScene, QFileDialog
+from PySide6.QtWidgets import QApplication, QFileDialog
 from threading import Event
 
+from Controllers.Display import ImageView, to_display
+from Controllers.Export import ExportDialog, ExportJob
 from Controllers.MouseDetector import MouseDetector
-from Controllers.Worker import Worker
-from Models.Effect.Cylinder import Cylinder
-from Models.Effect.FishEye_Effect import FishEye_Effect
-from Models.Effect.RadialBlur_Effect import RadialBlur_Effect
-from Models.Effect.SquareEye_Effect import SquareEye_Effect
-from Models.Effect.Swirl_Effect import Swirl_Effect
-from Models.Effect.Waves_Effect import Waves_Effect
-from Models.Filter.Gaussian_Filter import Gaussian_Filter
-from Models.Filter.Mean_Filter import Mean_Filter
-from Models.Filter.Median_Filter import Median_Filter
+from Controllers.Worker import Task, Worker
+from Models.Cache import fingerprint
+from Models.Effect.Resample import interpolation_order
+from Models.History import History
+from Models.ImageIO import Prefetcher, nearest_first, neighbours, save_image
+from Models.LargeImage import Large_Effect, is_large
+from Models.Profiler import profiler
+from Models.Proxy import Proxy, Proxy_Strips
+from Models.Registry import default_parameters, effect_job, parameters_key, scale_parameters
+
+# the proxy shown while a parameter changes is interpolated more cheaply, the full render and Apply stay cubic
+PREVIEW_INTERPOLATION = "bilinear"
+# the waves shift whole rows, their nearest preview only copies shifted rows of the proxy
+EFFECT_PREVIEW_INTERPOLATION = {"waves": "nearest"}
 
 
 class MyApplication:
     def __init__(self):
         loader = QUiLoader()
         self.window = loader.load("mainmenu.ui", None)
+        self.view = ImageView(self.window.graphicsView)
 
         # For threading
         QApplication.instance().aboutToQuit.connect(self.exit_handler)
@@ -32,9 +39,28 @@ class MyApplication:
         self.worker = Worker()
         self.threadpool.start(self.worker)
         self.worker.signals.processed.connect(self.update_image_view, Qt.QueuedConnection)
+        # exports get their own pool, the Worker occupies a thread of the other one for good
+        self.export_pool = QThreadPool()
+        self.export_job = None
+        # large images live in memory-mapped files in this directory, applying an effect to them is a Task
+        self.large_directory = None
+        self.large_job = None
+        # undo and redo replay effects on the last keyframe, that runs as a Task on the same pool
+        self.restore_job = None
+        # files are decoded and encoded on this pool, the neighbours of the open file are decoded ahead
+        self.io_pool = QThreadPool()
+        self.prefetcher = Prefetcher()
+        self.load_job = None
+        self.save_job = None
+        self.file_name = None
 
         self.image = None
-        self.images_stack = []
+        self.history = History()
+        self.proxy = None
+        self.fingerprint = None
+        self.full_job = None
+        self.job_id = 0
+        self.preview_job_id = None
 
         self.current_tab_idx = 0
         self.current_tab_name = "About"
@@ -43,6 +69,11 @@ class MyApplication:
                                    "Cylinder Anamorphosis": 4, "Radial Blur Effect": 5, "Square Eye Effect": 7, "Median Blurring": 8,
                                    "Gaussian Filtering": 9, "Mean Filter": 11, "About": 0}
 
+        self.tabs_to_effects = {"Fish Eye Effect": "fisheye", "Swirl Effect": "swirl", "Waves Effect": "waves",
+                                "Cylinder Anamorphosis": "cylinder", "Radial Blur Effect": "radial_blur",
+                                "Square Eye Effect": "square_eye", "Median Blurring": "median",
+                                "Gaussian Filtering": "gaussian", "Mean Filter": "mean"}
+
         self.parameters = self.get_default_parameters()
 
         self.fisheye_effect_parameters = [self.window.fisheye_x_slider, self.window.fisheye_y_slider,
@@ -96,6 +127,18 @@ class MyApplication:
 
     def exit_handler(self):
         self.worker.terminate = True
+        if self.export_job is not None:
+            self.export_job.token.cancel()
+        if self.large_job is not None:
+            self.large_job.token.cancel()
+        if self.restore_job is not None:
+            self.restore_job.token.cancel()
+        if self.load_job is not None:
+            self.load_job.token.cancel()
+        self.prefetcher.shutdown()
+        self.history.close()
+        if self.large_directory is not None:
+            shutil.rmtree(self.large_directory, ignore_errors=True)
 
     def mainmenu_setup(self):
         w = self.window
@@ -108,7 +151,7 @@ class MyApplication:
 
         w.treeWidget.expandAll()
 
-        self.disable_buttons([w.save_button, w.reset_button, w.undo_button,
+        self.disable_buttons([w.save_button, w.export_button, w.reset_button, w.undo_button, w.redo_button,
                               w.fisheye_apply_button, w.swirl_apply_button,
                               w.waves_apply_button, w.cylinder_apply_button,
                               w.radial_apply_button, w.square_eye_apply_button,
@@ -121,8 +164,16 @@ class MyApplication:
 
         w.load_button.clicked.connect(lambda l: self.load_button_event(w.graphicsView))
         w.save_button.clicked.connect(lambda l: self.save_button_event())
+        w.export_button.clicked.connect(lambda l: self.export_button_event())
         w.reset_button.clicked.connect(lambda l: self.reset_button_event("main_image"))
         w.undo_button.clicked.connect(lambda l: self.undo_button_event())
+        w.redo_button.clicked.connect(lambda l: self.redo_button_event())
+        QShortcut(QKeySequence.Undo, w, self.undo_button_event)
+        QShortcut(QKeySequence.Redo, w, self.redo_button_event)
+        QShortcut(QKeySequence("Ctrl+Shift+P"), w, self.toggle_profiler)
+        QShortcut(QKeySequence("Ctrl+Right"), w, lambda: self.browse(1))
+        QShortcut(QKeySequence("Ctrl+Left"), w, lambda: self.browse(-1))
+        QShortcut(QKeySequence("Ctrl+Shift+T"), w, self.save_trace)
         w.treeWidget.itemClicked.connect(self.dashboard_clicked_event)
 
         self.mouseFilter = MouseDetector()
@@ -278,74 +329,133 @@ class MyApplication:
             # print("update_image_function called")
 
     def update_image(self, effect_name):
-        if effect_name == "fisheye":
-            center_point = (self.parameters[effect_name]["y"], self.parameters[effect_name]["x"])
-            sigma = self.parameters[effect_name]["sigma"]
-            self.worker.process(FishEye_Effect, (self.image, center_point, sigma))
-
-        elif effect_name == "swirl":
-            center_point = (self.parameters[effect_name]["y"], self.parameters[effect_name]["x"])
-            sigma = self.parameters[effect_name]["sigma"]
-            magnitude = self.parameters[effect_name]["magnitude"]
-            # output_image = model.swirl_effect(self.image, center_point, sigma, magnitude)
-            self.worker.process(Swirl_Effect, (self.image, center_point, sigma, magnitude))
-
-        elif effect_name == "waves":
-            amplitude = [self.parameters[effect_name]["amplitude"], self.parameters[effect_name]["amplitude"]]
-            frequency = [self.parameters[effect_name]["frequency"], self.parameters[effect_name]["frequency"]]
-            phase = [self.parameters[effect_name]["phase"], self.parameters[effect_name]["phase"]]
-            # output_image = model.waves_effect(self.image, amplitude, frequency, phase)
-            self.worker.process(Waves_Effect, (self.image, amplitude, frequency, phase))
-
-        elif effect_name == "cylinder":
-            self.worker.process(Cylinder, (self.image, self.parameters[effect_name]["angle"]))
-
-        elif effect_name == "radial_blur":
-            self.worker.process(RadialBlur_Effect, (self.image, self.parameters[effect_name]["sigma"]))
-            # output_image = model.radial_blur_effect(self.image, sigma=self.parameters[effect_name]["sigma"])
-
-        elif effect_name == "square_eye":
-            center_point = (self.parameters[effect_name]["y"], self.parameters[effect_name]["x"])
-            sigma = self.parameters[effect_name]["sigma"]
-            p_value = self.parameters[effect_name]["p_value"]
-            # output_image = model.square_eye_effect(self.image, center_point, sigma, p_value)
-            self.worker.process(SquareEye_Effect, (self.image, center_point, sigma, p_value))
-
-        elif effect_name == "median":
-            self.worker.process(Median_Filter, (self.image, self.parameters[effect_name]["size"]))
-
-        elif effect_name == "gaussian":
-            self.worker.process(Gaussian_Filter, (self.image, self.parameters[effect_name]["radius"]))
-
-        elif effect_name == "mean":
-            self.worker.process(Mean_Filter, (self.image, self.parameters[effect_name]["size"]))
-
-    @Slot(object)
-    def update_image_view(self, output_image):
-        self.preview_image = output_image.copy()
-
-        if np.issubdtype(output_image.dtype, np.floating):
-            output_image = (output_image * 255).astype(np.uint8)
-
-        view_image = ImageQt.ImageQt(Image.fromarray(output_image))  # convert output_image to qimage
-        pixmap = QPixmap.fromImage(view_image)
-        self.scene = QGraphicsScene()
-        self.scene.addPixmap(pixmap)
-        self.window.graphicsView.setScene(self.scene)
-        item = self.window.graphicsView.items()
-        self.window.graphicsView.fitInView(item[0], Qt.KeepAspectRatio)
+        f, params = effect_job(effect_name, self.image, self.parameters[effect_name])
+        self.full_job = (f, params)
+        self.full_effect = (effect_name, dict(self.parameters[effect_name]))
+
+        preview = None
+        # moving a localized effect only updates the pixels around its old and new position on the view
+        regions = (self.full_effect, None)
+        proxy, scale = self.get_proxy()
+        if scale < 1.0:
+            proxy_parameters = scale_parameters(effect_name, self.parameters[effect_name], scale)
+            order = interpolation_order(EFFECT_PREVIEW_INTERPOLATION.get(effect_name, PREVIEW_INTERPOLATION))
+            preview = effect_job(effect_name, proxy, proxy_parameters, order)
+            regions = (self.full_effect, (effect_name, proxy_parameters))
+
+        info = self.full_effect
+        if is_large(self.image) and preview is not None:
+            # only the proxy is rendered while the parameters change, applying runs the effect tile by tile
+            self.job_id = self.worker.process(*preview, info=info, regions=(regions[1], None))
+            return
+
+        key = (self.get_fingerprint(), parameters_key(effect_name, self.parameters[effect_name]))
+        self.job_id = self.worker.process(f, params, preview, key, info, regions)
+
+    def get_fingerprint(self):
+        # hashed once per image, the image object is kept so a recycled id can never match
+        if self.fingerprint is None or self.fingerprint[0] is not self.image:
+            self.fingerprint = (self.image, fingerprint(self.image))
+        return self.fingerprint[1]
+
+    def get_proxy(self):
+        # kept with its image, compared with "is" like the fingerprint, a recycled id can never match
+        viewport = self.window.graphicsView.viewport().size()
+        size = (viewport.height(), viewport.width())
+        if self.proxy is None or self.proxy[0] is not self.image or self.proxy[1] != size:
+            proxy = Proxy_Strips if is_large(self.image) else Proxy
+            self.proxy = (self.image, size, *proxy(self.image, size))
+        return self.proxy[2], self.proxy[3]
+
+    def final_image(self):
+        # the last frame shown may be the low resolution proxy or an older job, render the full image before applying
+        if self.preview_job_id != self.job_id:
+            self.preview_image = self.worker.render(*self.full_job)
+            self.preview_job_id = self.job_id
+        return self.preview_image.copy()
+
+    def apply_preview(self, label):
+        # the effect applies to the state shown, a restore still running would replace it
+        self.cancel_restore()
+        if is_large(self.image):
+            self.apply_large(label)
+            return
+
+        previous = self.image
+        self.image = self.final_image()
+
+        # the state is stored as a replay record when it was rendered from the previous state
+        f, params = self.full_job
+        operation = (f, params[1:]) if params[0] is previous else None
+        self.history.push(label, self.image, operation)
+
+    def apply_large(self, label):
+        if self.large_job is not None:
+            self.window.statusbar.showMessage("An effect is still being applied")
+            return
+        effect_name, parameters = self.full_effect
+        self.large_job = Task(Large_Effect, self.image, effect_name, parameters, self.get_large_directory())
+        self.large_job.signals.progress.connect(
+            lambda i, total: self.window.statusbar.showMessage("Applying %s: %d%%" % (label, 100 * i // total)))
+        self.large_job.signals.finished.connect(lambda output: self.large_applied(label, output))
+        self.large_job.signals.failed.connect(self.large_failed)
+        self.export_pool.start(self.large_job)
+
+    def large_applied(self, label, output):
+        self.large_job = None
+        self.image = output
+        self.history.push(label, self.image)
+        self.show_image()
+        self.window.statusbar.showMessage("Applied %s" % label)
+
+    def large_failed(self, message):
+        self.large_job = None
+        self.show_image()
+        self.window.statusbar.showMessage("Applying the effect failed: %s" % message)
+
+    def get_large_directory(self):
+        if self.large_directory is None:
+            self.large_directory = tempfile.mkdtemp(prefix="ttcs_large_")
+        return self.large_directory
+
+    def show_image(self):
+        # a large image is shown through its proxy, it would not fit in a QImage
+        image = self.get_proxy()[0] if is_large(self.image) else self.image
+        self.view.show(to_display(image))  # To view image on the GraphicView
+
+    @Slot(object, object, bool, int, object)
+    def update_image_view(self, output_image, frame, is_proxy=False, job_id=None, patch=None):
+        if not is_proxy:
+            # every render returns a new array, so it can be kept without a copy
+            self.preview_image = output_image
+            self.preview_job_id = job_id
+
+        with profiler.span("show", job_id=job_id):
+            # a patch is only valid on the frame it was made from, anything else shown since gets the whole frame
+            if patch is not None and self.view.frame is patch[0]:
+                self.view.patch(frame, patch[1])
+            else:
+                self.view.show(frame)
+        if profiler.enabled:
+            self.window.statusbar.showMessage(profiler.readout())
+
+    def toggle_profiler(self):
+        # Ctrl+Shift+P, the stage timings of every render are then shown in the status bar
+        if profiler.enabled:
+            profiler.disable()
+            self.window.statusbar.showMessage("Profiler off")
+        else:
+            profiler.enable()
+            self.window.statusbar.showMessage("Profiler on, Ctrl+Shift+T saves a trace")
+
+    def save_trace(self):
+        file_name = QFileDialog.getSaveFileName(self.window, "Save Trace", "trace.json", "Trace Files (*.json)")[0]
+        if file_name:
+            profiler.dump(file_name)
+            self.window.statusbar.showMessage("Saved %d trace events to %s" % (len(profiler.events), file_name))
 
     def get_default_parameters(self):
-        parameters = {"fisheye": {"x": 0, "y": 0, "sigma": 1.0},
-                      "swirl": {"x": 0, "y": 0, "sigma": 0.01, "magnitude": 0},
-                      "waves": {"amplitude": 0.1, "frequency": 0.1, "phase": 0},
-                      "cylinder": {"angle": 0.0},
-                      "radial_blur": {"sigma": 0.1},
-                      "square_eye": {"x": 0, "y": 0, "sigma": 1.0, "p_value": 0.1},
-                      "median": {"size": 3.0},
-                      "gaussian": {"radius": 2.0},
-                      "mean": {"size": 3.0}, }
-        return parameters
+        return default_parameters()
 
     def disable_buttons(self, buttons):
         for button in buttons:
@@ -404,65 +514,135 @@ class MyApplication:
 
     @Slot()
     def load_button_event(self, graphicsView):
+        file_name = QFileDialog.getOpenFileName(self.window, "Open Image", ".", "Image Files (*.png *.jpg *.bmp)")[0]
+        if file_name != "":
+            self.open_file(file_name)
+
+    def open_file(self, file_name):
+        if self.large_job is not None:
+            self.window.statusbar.showMessage("An effect is still being applied")
+            return
+        if self.load_job is not None:
+            self.load_job.token.cancel()
+
+        # decoded on the io pool, the window stays responsive; a load superseded by another one is dropped
+        job = self.load_job = Task(self.prefetcher.load, file_name, self.get_large_directory())
+        name = os.path.basename(file_name)
+        job.signals.progress.connect(
+            lambda i, total: self.window.statusbar.showMessage("Loading %s: %d%%" % (name, 100 * i // total)))
+        job.signals.finished.connect(lambda result: self.image_loaded(job, file_name, *result))
+        job.signals.failed.connect(lambda message: self.load_failed(job, file_name, message))
+        self.window.statusbar.showMessage("Loading %s" % name)
+        self.io_pool.start(job)
+
+    def image_loaded(self, job, file_name, image, frame):
+        if job is not self.load_job:
+            return
         w = self.window
-        self.image_file_name = QFileDialog.getOpenFileName(self.window, "Open Image", ".",
-                                                           "Image Files (*.png *.jpg *.bmp)")
-
-        if self.image_file_name[0] != "":
-
-            reader = QImageReader(self.image_file_name[0])
-            reader.setAutoTransform(True)
-            new_image = reader.read()
-            if (new_image.isNull()):
-                print("Image not found")
-
-            self.scene = QGraphicsScene()
-            pixmap = QPixmap.fromImage(new_image)
-
-            self.scene.addPixmap(pixmap)
-            graphicsView.setScene(self.scene)
-            item = graphicsView.items()
-            graphicsView.fitInView(item[0], Qt.KeepAspectRatio)
-
-            if graphicsView.accessibleName() == "graphicsView":
-                # self.image = self.image_read(self.image_file_name[0], pilmode="RGB") / 255.0
-                self.image = Image.open(self.image_file_name[0])
-                self.image = np.array(self.image) / 255.0
-                if len(self.images_stack) == 1:
-                    self.images_stack.pop()
-                self.images_stack.append(("original image", self.image))
-
-                # enable the buttons that were disabled in the beginning
-                self.enable_buttons([w.save_button, w.reset_button,
-                                     w.fisheye_apply_button, w.swirl_apply_button,
-                                     w.waves_apply_button, w.cylinder_apply_button,
-                                     w.radial_apply_button,
-                                     w.square_eye_apply_button,
-                                     w.gaussian_apply_button, w.median_apply_button,
-                                     w.mean_apply_button])
-
-                self.set_parameter_limits()
+        self.load_job = None
+        self.file_name = file_name
+        self.image = image
+        if frame is None:
+            self.show_image()
+        else:
+            self.view.show(frame)
+        self.cancel_restore()
+        self.history.reset("original image", self.image)
+
+        # enable the buttons that were disabled in the beginning
+        self.enable_buttons([w.save_button, w.export_button, w.reset_button,
+                             w.fisheye_apply_button, w.swirl_apply_button,
+                             w.waves_apply_button, w.cylinder_apply_button,
+                             w.radial_apply_button,
+                             w.square_eye_apply_button,
+                             w.gaussian_apply_button, w.median_apply_button,
+                             w.mean_apply_button])
+
+        self.set_parameter_limits()
+        w.statusbar.showMessage("Loaded %s" % os.path.basename(file_name))
+        self.prefetcher.prefetch(nearest_first(*neighbours(file_name)))
+
+    def load_failed(self, job, file_name, message):
+        if job is self.load_job:
+            self.load_job = None
+            if message != "cancelled":
+                self.window.statusbar.showMessage("Loading %s failed: %s" % (os.path.basename(file_name), message))
+
+    def browse(self, step):
+        # Ctrl+Right / Ctrl+Left open the next / previous image of the folder
+        if self.file_name is None:
+            return
+        after, before = neighbours(self.file_name)
+        following = after if step > 0 else before
+        if following:
+            self.open_file(following[0])
 
     @Slot()
     def save_button_event(self):
         file_name_to_save = \
             QFileDialog.getSaveFileName(self.window, "Open Image", ".", "Image Files (*.png *.jpg *.bmp)")[0]
+        if file_name_to_save == "":
+            return
 
         extension_list = ["png", "jpg", "jpeg"]
         if any(substring in file_name_to_save for substring in extension_list) == False:
             file_name_to_save = file_name_to_save + ".png"
 
-        image_to_be_saved = self.image.copy()
-        if np.issubdtype(image_to_be_saved.dtype, np.floating):
-            image_to_be_saved = (self.image * 255).astype(np.uint8)
+        # the image is never modified in place, it is encoded in the background while editing goes on
+        self.save_job = Task(save_image, self.image, file_name_to_save)
+        name = os.path.basename(file_name_to_save)
+        self.save_job.signals.progress.connect(
+            lambda i, total: self.window.statusbar.showMessage("Saving %s: %d%%" % (name, 100 * i // total)))
+        self.save_job.signals.finished.connect(lambda _: self.window.statusbar.showMessage("Saved %s" % name))
+        self.save_job.signals.failed.connect(
+            lambda message: self.window.statusbar.showMessage("Saving %s failed: %s" % (name, message)))
+        self.io_pool.start(self.save_job)
 
-        self.image_write(image_to_be_saved, file_name_to_save)
+    @Slot()
+    def export_button_event(self):
+        effect_name = self.tabs_to_effects.get(self.current_tab_name)
+        if effect_name is None:
+            self.window.statusbar.showMessage("Select an effect to export")
+            return
+        if self.export_job is not None:
+            self.window.statusbar.showMessage("An export is already running")
+            return
+        if is_large(self.image):
+            self.window.statusbar.showMessage("Animations cannot be exported from large images")
+            return
+
+        dialog = ExportDialog(self.window, self.parameters[effect_name])
+        if not dialog.exec():
+            return
+        parameter_name, values, fps = dialog.sweep()
+
+        file_name = QFileDialog.getSaveFileName(self.window, "Export Animation", ".",
+                                                "Animations (*.gif *.mp4);;Frame sequence (*.png)")[0]
+        if file_name == "":
+            return
+        if file_name.lower().endswith(".png") and "%" not in file_name:
+            # one numbered file per frame
+            file_name = file_name[:-4] + "_%04d.png"
+
+        self.export_job = ExportJob(self.image, effect_name, self.parameters[effect_name], parameter_name, values,
+                                    file_name, fps)
+        self.export_job.signals.progress.connect(
+            lambda i, total: self.window.statusbar.showMessage("Exporting frame %d/%d" % (i, total)))
+        self.export_job.signals.finished.connect(self.export_finished)
+        self.export_pool.start(self.export_job)
+
+    def export_finished(self, message):
+        self.export_job = None
+        self.window.statusbar.showMessage(message)
 
     @Slot()
     def reset_button_event(self, image="main_image"):
-        self.window.graphicsView.setScene(None)
+        self.view.clear()
         self.image = None
-        self.disable_buttons([self.window.save_button, self.window.reset_button, self.window.undo_button,
+        self.fingerprint = None
+        self.disable_buttons([self.window.save_button, self.window.export_button, self.window.reset_button,
+                              self.window.undo_button,
+                              self.window.redo_button,
                               self.window.fisheye_apply_button, self.window.swirl_apply_button,
                               self.window.waves_apply_button, self.window.cylinder_apply_button,
                               self.window.radial_apply_button,
@@ -470,25 +650,53 @@ class MyApplication:
                               self.window.median_apply_button, self.window.mean_apply_button])
 
     def undo_button_event(self):
-        if len(self.images_stack) > 1:
-            self.images_stack.pop()
-            self.image = self.images_stack[-1][1].copy()
-            view_image = self.images_stack[-1][1].copy()  # To view image on the GraphicView
-
-            if np.issubdtype(view_image.dtype, np.floating):
-                view_image = (view_image * 255).astype(np.uint8)
-
-            view_image = ImageQt.ImageQt(Image.fromarray(view_image))  # convert view_image to qimage
-            pixmap = QPixmap.fromImage(view_image)
-            self.scene = QGraphicsScene()
-            self.scene.addPixmap(pixmap)
-            self.window.graphicsView.setScene(self.scene)
-            item = self.window.graphicsView.items()
-            self.window.graphicsView.fitInView(item[0], Qt.KeepAspectRatio)
-
-            #print("----------------------->",len(self.images_stack))
-            if len(self.images_stack) == 1:
-                self.disable_buttons([self.window.undo_button])
+        if self.image is not None and self.large_job is None and self.history.can_undo():
+            self.restore_state(self.history.index - 1)
+
+    def redo_button_event(self):
+        if self.image is not None and self.large_job is None and self.history.can_redo():
+            self.restore_state(self.history.index + 1)
+
+    def restore_state(self, index):
+        # the state is shown and becomes current once the Task has rebuilt it, undo and redo wait until then
+        if self.restore_job is not None:
+            return
+        self.window.undo_button.setEnabled(False)
+        self.window.redo_button.setEnabled(False)
+        label = self.history.labels[index]
+        job = self.restore_job = Task(self.history.restore, index)
+        job.signals.progress.connect(
+            lambda i, total: self.window.statusbar.showMessage("Restoring %s: %d%%" % (label, 100 * i // total)))
+        job.signals.finished.connect(lambda image: self.state_restored(job, index, image))
+        job.signals.failed.connect(lambda message: self.restore_failed(job, message))
+        self.export_pool.start(job)
+
+    def state_restored(self, job, index, image):
+        if job is not self.restore_job:
+            return
+        self.restore_job = None
+        self.history.move(index, image)
+        self.show_history_state(image)
+        self.window.statusbar.clearMessage()
+
+    def restore_failed(self, job, message):
+        if job is not self.restore_job:
+            return
+        self.restore_job = None
+        self.show_history_state(self.image)
+        self.window.statusbar.showMessage("Restoring the state failed: %s" % message)
+
+    def cancel_restore(self):
+        if self.restore_job is not None:
+            self.restore_job.token.cancel()
+            self.restore_job = None
+
+    def show_history_state(self, image):
+        self.image = image
+        self.show_image()
+
+        self.window.undo_button.setEnabled(self.history.can_undo())
+        self.window.redo_button.setEnabled(self.history.can_redo())
 
     @Slot()
     def dashboard_clicked_event(self, position, column):
@@ -506,96 +714,90 @@ class MyApplication:
 
     @Slot()
     def fisheye_effect_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("fish eye effect", self.image))  # added to the stack
+        self.apply_preview("fish eye effect")  # added to the history
 
         for widget in self.fisheye_effect_parameters:
             widget.setEnabled(False)
         self.window.fisheye_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
+        self.window.redo_button.setEnabled(False)
 
     @Slot()
     def swirl_effect_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("swirl effect", self.image))  # added to the stack
+        self.apply_preview("swirl effect")  # added to the history
 
         for widget in self.swirl_effect_parameters:
             widget.setEnabled(False)
         self.window.swirl_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
+        self.window.redo_button.setEnabled(False)
 
     @Slot()
     def waves_effect_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("waves effect", self.image))  # added to the stack
+        self.apply_preview("waves effect")  # added to the history
 
         for widget in self.waves_effect_parameters:
             widget.setEnabled(False)
         self.window.waves_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
+        self.window.redo_button.setEnabled(False)
 
     @Slot()
     def cylinder_effect_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("cylinder effect", self.image))  # added to the stack
+        self.apply_preview("cylinder effect")  # added to the history
 
         for widget in self.cylinder_effect_parameters:
             widget.setEnabled(False)
         self.window.cylinder_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
+        self.window.redo_button.setEnabled(False)
 
     @Slot()
     def radial_blur_effect_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("radial blur effect", self.image))  # added to the stack
+        self.apply_preview("radial blur effect")  # added to the history
 
         for widget in self.radial_blur_effect_parameters:
             widget.setEnabled(False)
         self.window.radial_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
+        self.window.redo_button.setEnabled(False)
 
     @Slot()
     def square_eye_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("square eye effect", self.image))  # added to the stack
+        self.apply_preview("square eye effect")  # added to the history
 
         for widget in self.square_eye_effect_parameters:
             widget.setEnabled(False)
         self.window.square_eye_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
+        self.window.redo_button.setEnabled(False)
 
     @Slot()
     def gaussian_blur_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("gaussian blur effect", self.image))  # added to the stack
+        self.apply_preview("gaussian blur effect")  # added to the history
 
         for widget in self.gaussian_blur_parameters:
             widget.setEnabled(False)
         self.window.gaussian_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
+        self.window.redo_button.setEnabled(False)
 
     @Slot()
     def median_blur_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("median blur effect", self.image))  # added to the stack
+        self.apply_preview("median blur effect")  # added to the history
 
         for widget in self.median_blur_parameters:
             widget.setEnabled(False)
         self.window.median_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
+        self.window.redo_button.setEnabled(False)
 
     @Slot()
     def mean_blur_apply_button_event(self):
-        self.image = self.preview_image.copy()
-        self.images_stack.append(("mean blur effect", self.image))  # added to the stack
+        self.apply_preview("mean blur effect")  # added to the history
 
         for widget in self.mean_blur_parameters:
             widget.setEnabled(False)
         self.window.mean_apply_button.setEnabled(False)
         self.window.undo_button.setEnabled(True)
-
-    def image_read(self, file_name, pilmode='RGB', arrtype=np.floating):
-        return imageio.imread(file_name, pilmode=pilmode).astype(arrtype)
-
-    def image_write(self, image, file_name, arrtype=np.uint8):
-        imageio.imwrite(file_name, np.array(image).astype(arrtype))
+        self.window.redo_button.setEnabled(False)
@@ -1,13 +1,21 @@
 import sys
+import time
 import traceback
+import weakref
 from threading import Event
 
 import numpy as np
-from PySide6.QtCore import QObject, Signal, QRunnable, QMutex, QThreadPool, Slot
+from PySide6.QtCore import QObject, Signal, QRunnable, QMutex, Slot
+
+from Controllers.Display import to_display
+from Models.Cache import LRUCache
+from Models.Cancellation import CancelToken, Cancelled
+from Models.Profiler import profiler
+from Models.Registry import dirty_window
 
 
 class WorkerSignals(QObject):
-    processed = Signal(object)
+    processed = Signal(object, object, bool, int, object)
     terminated = Signal()
 
 
@@ -20,8 +28,21 @@ class Worker(QRunnable):
         self.mutex = QMutex()
         self.f = None
         self.params = None
-        self.split_dimensions = True
-        self.threadpool = QThreadPool()
+        self.preview = None
+        self.key = None
+        # (effect name, parameters) of the job and the time it was submitted, for the profiler
+        self.info = None
+        self.queued = None
+        # (effect name, parameters) of the full and the preview job, their frames are patched when possible
+        self.regions = (None, None)
+        # (image, region, frame) of the last frame emitted for the full and the proxy resolution
+        self.previous = {}
+        # full resolution results and their display frames, keyed by image fingerprint and effect parameters
+        self.results = LRUCache(512 * 1024 ** 2)
+        self.token = CancelToken()
+        self.job_id = 0
+        # seconds a parameter has to stay unchanged before the full resolution render starts
+        self.idle_delay = 0.25
 
     def run(self):
         print("Worker started")
@@ -33,56 +54,133 @@ class Worker(QRunnable):
 
             if self.new_data_arrived.is_set():
                 self.mutex.lock()
+                if not self.new_data_arrived.is_set():
+                    # the job was served from the result cache in the meantime
+                    self.mutex.unlock()
+                    continue
                 self.new_data_arrived.clear()
                 f = self.f
                 params = self.params
+                preview = self.preview
+                key = self.key
+                info = self.info
+                queued = self.queued
+                regions = self.regions
+                job_id = self.job_id
+                token = self.token = CancelToken()
                 self.mutex.unlock()
 
                 try:
-                    if len(params[0].shape) == 2 or not self.split_dimensions:
-                        output = f(*params)
-                    elif len(params[0].shape) == 3:
-                        finished_events = []
-                        output = []
-
-                        for i in range(params[0].shape[2]):
-                            output.append(None)
-                            e = Event()
-                            finished_events.append(e)
-                            params_ = (params[0][:, :, i], *(params[1:]))
-                            temp_worker = TemporaryWorker(f, params_, output, i, e)
-                            self.threadpool.start(temp_worker)
-
-                        for e in finished_events:
-                            e.wait()
-
-                        output = np.stack(output, axis=2)
-                    self.signals.processed.emit(np.array(output))
+                    if preview is not None:
+                        try:
+                            with self.profile(preview[0], preview[1], info, queued, "preview"):
+                                self.emit(self.render(*preview, token=token), True, job_id, token, preview[1][0],
+                                          regions[1])
+                        except Cancelled:
+                            raise
+                        except Exception:
+                            # a failed preview still gets the full resolution render
+                            traceback.print_exc()
+                        if self.new_data_arrived.wait(timeout=self.idle_delay):
+                            continue
+
+                    with self.profile(f, params, info, queued, "full"):
+                        output = self.render(f, params, token)
+                        frame = self.emit(output, False, job_id, token, params[0], regions[0])
+                    if key is not None:
+                        self.results.put(key, (output, frame))
+                except Cancelled:
+                    pass
                 except Exception:
                     exc_info = sys.exc_info()
                     traceback.print_exception(*exc_info)
         print("Worker stopped")
 
+    def emit(self, output, is_proxy, job_id, token, image=None, region=None):
+        # the uint8 display frame is made here, so the GUI thread only wraps it in a QImage. When the last frame of
+        # this resolution shows the same effect on the same image, only the window that can differ is converted,
+        # and sent as a patch of that frame
+        window = None
+        previous = self.previous.get(is_proxy)
+        if region is not None and previous is not None and previous[0]() is image and previous[1][0] == region[0] \
+                and previous[2].shape == output.shape:
+            window = dirty_window(region[0], output.shape, region[1], previous[1][1])
+
+        with profiler.span("display"):
+            if window is None:
+                frame = to_display(output)
+            else:
+                r0, r1, c0, c1 = window
+                frame = previous[2].copy()
+                frame[r0:r1, c0:c1] = to_display(output[r0:r1, c0:c1])
+        patch = None if window is None else (previous[2], window)
+
+        # a job superseded while rendering must never reach the view
+        self.mutex.lock()
+        if not token.cancelled:
+            with profiler.span("emit"):
+                self.signals.processed.emit(output, frame, is_proxy, job_id, patch)
+            self.previous[is_proxy] = (weakref.ref(image), region, frame) if region is not None else None
+        self.mutex.unlock()
+        return frame
+
+    def render(self, f, params, token=None):
+        # the Models functions handle every channel at once and spread their row bands over Models.Tiling
+        with profiler.span("effect"):
+            return np.asarray(f(*params, token=token))
+
+    def profile(self, f, params, info, queued, kind):
+        name, parameters = info if info is not None else (getattr(f, "__name__", "job"), None)
+        image = params[0] if params and isinstance(params[0], np.ndarray) else None
+        return profiler.job(name, image, parameters, queued, kind=kind)
+
     @Slot(object, object)
-    def process(self, f, parameters, split_dimensions=True):
+    def process(self, f, parameters, preview=None, key=None, info=None, regions=(None, None)):
         self.mutex.lock()
         self.f = f
         self.params = parameters
-        self.split_dimensions = split_dimensions
-        self.new_data_arrived.set()
+        self.preview = preview
+        self.key = key
+        self.info = info
+        self.regions = regions
+        self.queued = time.perf_counter()
+        self.token.cancel()
+        self.job_id += 1
+        job_id = self.job_id
+
+        cached = None if key is None else self.results.get(key)
+        if cached is None:
+            self.new_data_arrived.set()
+        else:
+            self.new_data_arrived.clear()
+            with self.profile(f, parameters, info, self.queued, "cached"):
+                self.signals.processed.emit(*cached, False, job_id, None)
         self.mutex.unlock()
+        return job_id
 
 
-class TemporaryWorker(QRunnable):
-    def __init__(self, f, params, output, idx, finished_event):
-        super(TemporaryWorker, self).__init__()
-        self.f = f
-        self.params = params
-        self.output = output
-        self.idx = idx
-        self.finished_event = finished_event
+class TaskSignals(QObject):
+    progress = Signal(int, int)
+    finished = Signal(object)
+    failed = Signal(str)
+
+
+class Task(QRunnable):
+    # runs fn(*args, token=..., progress=...) once on a thread pool
+    def __init__(self, fn, *args):
+        super(Task, self).__init__()
+        self.signals = TaskSignals()
+        self.token = CancelToken()
+        self.fn = fn
+        self.args = args
 
-    @Slot()
     def run(self):
-        self.output[self.idx] = self.f(*self.params)
-        self.finished_event.set()
+        try:
+            result = self.fn(*self.args, token=self.token,
+                             progress=lambda i, total: self.signals.progress.emit(i, total))
+            self.signals.finished.emit(result)
+        except Cancelled:
+            self.signals.failed.emit("cancelled")
+        except Exception as e:
+            traceback.print_exception(*sys.exc_info())
+            self.signals.failed.emit(str(e))
@@ -0,0 +1,134 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from Models import Tiling
+from Models.Cancellation import check
+from Models.Precision import from_working
+from Models.Registry import DEFAULT_PARAMETERS, effect_job, effect_map
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+
+
+def parse_sweep(spec, effect_name):
+    # "magnitude=0:10" -> ("magnitude", 0.0, 10.0)
+    name, _, values = spec.partition("=")
+    name = name.strip()
+    if name not in DEFAULT_PARAMETERS[effect_name]:
+        raise ValueError("Unknown parameter '%s' for %s, expected one of: %s"
+                         % (name, effect_name, ", ".join(DEFAULT_PARAMETERS[effect_name])))
+    start, _, stop = values.partition(":")
+    return name, float(start), float(stop)
+
+
+def sweep_values(start, stop, frames):
+    return [float(v) for v in np.linspace(start, stop, max(1, int(frames)))]
+
+
+def frame_shape(effect_name, shape, parameters, parameter_name, values):
+    # the largest output over the sweep, every frame is padded to it since encoders need one frame size
+    m, n = shape[:2]
+    for value in values:
+        stage = effect_map(effect_name, shape, dict(parameters, **{parameter_name: value}))
+        if stage is not None:
+            m, n = max(m, stage[0][0]), max(n, stage[0][1])
+    return m, n
+
+
+def fit_frame(frame, shape):
+    m, n = frame.shape[:2]
+    if (m, n) == tuple(shape):
+        return frame
+    top, left = (shape[0] - m) // 2, (shape[1] - n) // 2
+    padding = ((top, shape[0] - m - top), (left, shape[1] - n - left)) + ((0, 0),) * (frame.ndim - 2)
+    return np.pad(frame, padding)
+
+
+class AnimationWriter:
+    # frames go straight to the encoder (video) or to disk (frame sequence); a GIF is written on close,
+    # its frames are only kept palettized, one byte per pixel
+    def __init__(self, file_name, fps=20):
+        self.file_name = file_name
+        self.fps = fps
+        self.count = 0
+        self.frames = []
+        self.writer = None
+        extension = os.path.splitext(file_name)[1].lower()
+        os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+
+        if extension == ".gif":
+            self.kind = "gif"
+        elif extension in VIDEO_EXTENSIONS:
+            import imageio
+            # needs the imageio-ffmpeg package
+            self.writer = imageio.get_writer(file_name, fps=fps, macro_block_size=1)
+            self.kind = "video"
+        else:
+            # "frames/swirl_%04d.png", or a directory the frames are numbered in
+            if "%" not in file_name:
+                self.file_name = os.path.join(file_name, "frame_%04d.png")
+            os.makedirs(os.path.dirname(self.file_name) or ".", exist_ok=True)
+            self.kind = "sequence"
+
+    def append(self, frame):
+        if self.kind == "gif":
+            image = Image.fromarray(frame[:, :, :3] if frame.ndim == 3 else frame)
+            self.frames.append(image.convert("P", palette=Image.ADAPTIVE) if image.mode == "RGB" else image)
+        elif self.kind == "video":
+            self.writer.append_data(np.dstack([frame] * 3) if frame.ndim == 2 else frame[:, :, :3])
+        else:
+            Image.fromarray(frame).save(self.file_name % self.count)
+        self.count += 1
+
+    def close(self):
+        if self.kind == "gif" and self.frames:
+            self.frames[0].save(self.file_name, save_all=True, append_images=self.frames[1:],
+                                duration=int(round(1000 / self.fps)), loop=0)
+            self.frames = []
+        elif self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def render_frame(image, effect_name, parameters, parameter_name, value, shape, token=None):
+    f, params = effect_job(effect_name, image, dict(parameters, **{parameter_name: value}))
+    return fit_frame(from_working(f(*params, token=token)), shape)
+
+
+def render_frames(image, effect_name, parameters, parameter_name, values, lookahead=None, token=None):
+    # frames are rendered in parallel on threads of their own (their bands then run inline) and yielded in order,
+    # never more than lookahead frames ahead of the consumer; the sweep shares the cached coordinate grids.
+    # The tile pool stays free for the interactive renders, which would otherwise queue behind whole frames
+    shape = frame_shape(effect_name, image.shape, parameters, parameter_name, values)
+    threads = max(1, Tiling.workers - 1)
+    lookahead = lookahead or threads + 1
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="frame", initializer=Tiling.mark_pool_thread)
+    pending = deque()
+    try:
+        for value in values:
+            check(token)
+            pending.append(executor.submit(render_frame, image, effect_name, parameters, parameter_name, value, shape,
+                                           token))
+            while len(pending) >= lookahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def Export_Animation(image, effect_name, parameters, parameter_name, values, file_name, fps=20, lookahead=None,
+                     token=None, progress=None):
+    writer = AnimationWriter(file_name, fps)
+    try:
+        for i, frame in enumerate(render_frames(image, effect_name, parameters, parameter_name, values, lookahead,
+                                                token)):
+            writer.append(frame)
+            if progress is not None:
+                progress(i + 1, len(values))
+    finally:
+        writer.close()
+    return writer.count
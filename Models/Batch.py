@@ -0,0 +1,190 @@
+import argparse
+import glob
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from PIL import Image
+
+from Models import Tiling
+from Models.Filter.Median_Filter import get_median_method, set_median_method
+from Models.LargeImage import Large_Effect, open_large, save_large
+from Models.Pipeline import Pipeline
+from Models.Precision import from_working, get_working_dtype, set_working_dtype, to_working
+from Models.Registry import DEFAULT_PARAMETERS
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def parse_effect(spec):
+    # "swirl:x=120,y=80,magnitude=4" -> ("swirl", {...defaults overridden by the given values})
+    name, _, arguments = spec.partition(":")
+    name = name.strip()
+    if name not in DEFAULT_PARAMETERS:
+        raise ValueError("Unknown effect '%s', expected one of: %s" % (name, ", ".join(DEFAULT_PARAMETERS)))
+
+    parameters = dict(DEFAULT_PARAMETERS[name])
+    for argument in filter(None, arguments.split(",")):
+        key, _, value = argument.partition("=")
+        key = key.strip()
+        if key not in parameters:
+            raise ValueError("Unknown parameter '%s' for %s, expected one of: %s"
+                             % (key, name, ", ".join(parameters)))
+        parameters[key] = float(value)
+    return name, parameters
+
+
+def effect_argument(spec):
+    # parse_effect as an argparse type: argparse only shows the message of an ArgumentTypeError,
+    # a ValueError becomes "invalid value"
+    try:
+        return parse_effect(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def find_images(inputs):
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = sorted(os.path.join(item, f) for f in os.listdir(item))
+        else:
+            candidates = sorted(glob.glob(item))
+        files.extend(f for f in candidates if os.path.isfile(f) and f.lower().endswith(IMAGE_EXTENSIONS))
+    return files
+
+
+def read_image(file_name):
+    with Image.open(file_name) as image:
+        if image.mode not in ("L", "RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        return to_working(image)
+
+
+def write_image(image, file_name):
+    image = from_working(image)
+    if file_name.lower().endswith((".jpg", ".jpeg")) and image.ndim == 3 and image.shape[2] == 4:
+        image = image[:, :, :3]
+    Image.fromarray(image).save(file_name)
+
+
+def apply_chain(image, chain, token=None):
+    # consecutive geometric effects of the chain are resampled once
+    return Pipeline(chain)(image, token)
+
+
+def output_name(file_name, output_dir, extension=None):
+    base, ext = os.path.splitext(os.path.basename(file_name))
+    return os.path.join(output_dir, base + ("." + extension.lstrip(".") if extension else ext))
+
+
+def output_names(files, output_dir, extension=None):
+    # output file of every input, refusing a batch that would overwrite an input or write two images to one file
+    outputs = [output_name(f, output_dir, extension) for f in files]
+    inputs = {os.path.normcase(os.path.abspath(f)) for f in files}
+    seen = {}
+    for file_name, output in zip(files, outputs):
+        key = os.path.normcase(os.path.abspath(output))
+        if key in inputs or os.path.exists(output) and os.path.samefile(output, file_name):
+            raise ValueError("%s would overwrite the input %s, choose another output directory or format"
+                             % (output, file_name))
+        if key in seen:
+            raise ValueError("%s and %s would both be written to %s" % (seen[key], file_name, output))
+        seen[key] = file_name
+    return outputs
+
+
+def process_file(file_name, output_file, chain, large=False):
+    if large:
+        return process_large_file(file_name, output_file, chain)
+
+    start = time.perf_counter()
+    image = read_image(file_name)
+    loaded = time.perf_counter()
+
+    image = apply_chain(image, chain)
+    processed = time.perf_counter()
+
+    write_image(image, output_file)
+    written = time.perf_counter()
+
+    return {"file": file_name, "output": output_file, "megapixels": image.shape[0] * image.shape[1] / 1e6,
+            "read": loaded - start, "process": processed - loaded, "write": written - processed}
+
+
+def process_large_file(file_name, output_file, chain):
+    # the image and every intermediate result are memory-mapped files, each effect runs tile by tile.
+    # Windows cannot delete a file that is still mapped: the maps are released before the directory is removed,
+    # after an error they may still be referenced by the traceback and the cleanup is left to the system
+    with tempfile.TemporaryDirectory(prefix="ttcs_large_", ignore_cleanup_errors=True) as directory:
+        start = time.perf_counter()
+        image = open_large(file_name, directory)
+        loaded = time.perf_counter()
+
+        for effect_name, parameters in chain:
+            image = Large_Effect(image, effect_name, parameters, directory)
+        processed = time.perf_counter()
+
+        save_large(image, output_file)
+        written = time.perf_counter()
+        megapixels = image.shape[0] * image.shape[1] / 1e6
+        del image
+
+    return {"file": file_name, "output": output_file, "megapixels": megapixels,
+            "read": loaded - start, "process": processed - loaded, "write": written - processed}
+
+
+def init_process(threads, dtype, median):
+    Tiling.set_workers(threads)
+    set_working_dtype(dtype)
+    set_median_method(median)
+
+
+def report_line(result):
+    total = result["read"] + result["process"] + result["write"]
+    return "%s: %.1f MP, read %.2fs, process %.2fs, write %.2fs, %.2f MP/s" % (
+        os.path.basename(result["file"]), result["megapixels"], result["read"], result["process"],
+        result["write"], result["megapixels"] / max(total, 1e-9))
+
+
+def run_batch(files, output_dir, chain, jobs=None, in_flight=None, extension=None, report=print, large=False):
+    jobs = jobs or os.cpu_count() or 1
+    # at most this many images are decoded or being processed at any time
+    in_flight = in_flight or 2 * jobs
+    outputs = output_names(files, output_dir, extension)
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+
+    def collect(file_name, result):
+        try:
+            results.append(result())
+            report(report_line(results[-1]))
+        except Exception as e:
+            report("%s: failed, %s" % (os.path.basename(file_name), e))
+
+    start = time.perf_counter()
+    if jobs == 1:
+        for file_name, output in zip(files, outputs):
+            collect(file_name, lambda: process_file(file_name, output, chain, large))
+    else:
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+        initargs = (threads, get_working_dtype(), get_median_method())
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_process, initargs=initargs) as pool:
+            pending = {}
+            for file_name, output in zip(files, outputs):
+                future = pool.submit(process_file, file_name, output, chain, large)
+                pending[future] = file_name
+                while len(pending) >= in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(pending.pop(future), future.result)
+            for future in wait(pending).done:
+                collect(pending[future], future.result)
+
+    elapsed = time.perf_counter() - start
+    megapixels = sum(r["megapixels"] for r in results)
+    report("%d images, %.1f MP in %.2fs, %.2f MP/s" % (len(results), megapixels, elapsed,
+                                                       megapixels / max(elapsed, 1e-9)))
+    return results
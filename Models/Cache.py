@@ -0,0 +1,115 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+def nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(v) for v in value)
+    return 0
+
+
+def fingerprint(arr):
+    # content hash of an array, equal images get equal fingerprints whatever object holds them
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((arr.shape, arr.dtype.str)).encode())
+    digest.update(np.ascontiguousarray(arr).data)
+    return digest.hexdigest()
+
+
+def cached_for(cache, arr, key, build):
+    # build() cached for as long as arr is alive, arrays are identified by id and never modified in place
+    key = (id(arr), arr.shape, arr.dtype.str) + tuple(key)
+
+    def create():
+        # the entry is dropped with its array
+        return weakref.ref(arr, lambda _: cache.discard(key)), build()
+
+    ref, value = cache.get_or_create(key, create)
+    if ref() is not arr:
+        # the cached entry belonged to a freed array whose id was reused
+        ref, value = cache.put(key, create())
+    return value
+
+
+class LRUCache:
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.building = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = nbytes(value)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size <= self.budget:
+                self.entries[key] = (value, size)
+                self.size += size
+                self.evict()
+        return value
+
+    def get_or_create(self, key, factory):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            build_lock = self.building.setdefault(key, threading.Lock())
+
+        # only one thread builds a given entry, the others wait for it
+        with build_lock:
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    return self.entries[key][0]
+            try:
+                value = self.put(key, factory())
+            finally:
+                with self.lock:
+                    self.building.pop(key, None)
+        return value
+
+    def evict(self):
+        while self.size > self.budget and self.entries:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.size -= size
+
+    def discard(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+    def set_budget(self, budget):
+        with self.lock:
+            self.budget = budget
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                    "bytes": self.size, "budget": self.budget}
@@ -1,27 +1,47 @@
 import numpy as np
-import scipy.ndimage as img
 
+from Models.Effect.Grid_Cache import angle_grid, polar_grid, windowed_grid
+from Models.Effect.Resample import Warp
+from Models.Precision import clip_unit, get_working_dtype
 
-def Cylinder(arrF, angle_shift):
-    m, n = arrF.shape
-    u, v = np.meshgrid(np.arange(n), np.arange(m))
-    matX = np.stack((v, u)).astype(float)
 
-    vecC = np.array([arrF.shape[0] // 2, arrF.shape[1] // 2]).reshape(2, 1, 1)
-    diff = matX - vecC
+def angle_range(m, n):
+    if m < 2 or n < 2:
+        angle = angle_grid((m, n), (m // 2, n // 2))
+        return float(angle.min()), float(angle.max())
+    # the extreme angles lie left of the center, on the center row and on the row above it
+    angle = np.arctan2(np.array([[-1.0], [0.0]]), np.arange(n) - n // 2).astype(get_working_dtype())
+    return float(angle.min()), float(angle.max())
 
-    r = np.linalg.norm(diff, axis=0)
-    y = (r / (arrF.shape[0] // 2)) * (arrF.shape[0] - 1)
 
-    angle = np.arctan2(diff[0], diff[1])
-    angle -= angle.min()
-    angle /= angle.max()
-    angle = (angle + angle_shift / 360.0) % 1.0
-    x = angle * (arrF.shape[1] - 1)
+def cylinder_grid(shape, window=None):
+    m, n = shape[:2]
+    vecC = (m // 2, n // 2)
+    amin, amax = angle_range(m, n)
 
-    matX = np.stack([y, x])
+    def build(window):
+        _, r = polar_grid(shape, vecC, window)
+        y = (r / (m // 2)) * (m - 1)
 
-    arrG = img.map_coordinates(np.flipud(arrF), matX)
-    arrG = arrG.reshape(m, n)
+        angle = angle_grid(shape, vecC, window) - amin
+        angle /= amax - amin
+        # the source image is sampled upside down
+        return (m - 1) - y, angle
 
-    return np.clip(arrG, 0, 1)
+    return windowed_grid(("cylinder", m, n, get_working_dtype().str), shape, window, 2, build)
+
+
+def Cylinder_Map(shape, angle_shift, window=None):
+    y, angle = cylinder_grid(shape, window)
+
+    x = ((angle + angle_shift / 360.0) % 1.0) * (shape[1] - 1)
+
+    return np.stack([y, x])
+
+
+def Cylinder(arrF, angle_shift, order=3, token=None):
+    n = arrF.shape[1]
+
+    arrG = Warp(arrF, lambda r0, r1: Cylinder_Map(arrF.shape, angle_shift, (r0, r1, 0, n)), order=order, token=token)
+
+    return clip_unit(arrG)
@@ -1,23 +1,25 @@
 import numpy as np
-import scipy.ndimage as img
+
+from Models.Effect.Grid_Cache import base_grid, polar_grid, support_window
+from Models.Effect.Resample import Warp_Window
 
 
 def delta(r, sigma):
     return np.where(r < sigma, 1 - r / sigma, 0)
 
 
-def FishEye_Effect(arrF, vecC, sigma=100, dfct=delta):
-    vecC = np.array(vecC).reshape(-1, 1)
-    m, n = arrF.shape
-    u, v = np.meshgrid(np.arange(n), np.arange(m))
+def FishEye_Map(shape, vecC, sigma=100, dfct=delta, window=None):
+    diff, dist = polar_grid(shape, vecC, window)
+    return base_grid(shape, window) - diff * dfct(dist, sigma)
+
 
-    matX = np.vstack((v.flatten(), u.flatten())).astype(float)
-    matR = vecC - matX
+def FishEye_Support(shape, vecC, sigma=100):
+    # delta is zero from sigma on, nothing moves outside this window
+    return support_window(shape, vecC, max(float(sigma), 0.0))
 
-    dist = np.sqrt(np.sum(matR ** 2, axis=0))
-    matX = matX + matR * dfct(dist, sigma)
 
-    arrG = img.map_coordinates(arrF, matX)
-    arrG = arrG.reshape(m, n)
+def FishEye_Effect(arrF, vecC, sigma=100, dfct=delta, order=3, token=None):
+    # other displacement functions may reach further than sigma, those are warped over the whole image
+    window = FishEye_Support(arrF.shape, vecC, sigma) if dfct is delta else None
 
-    return np.clip(arrG, 0, 1)
+    return Warp_Window(arrF, lambda w: FishEye_Map(arrF.shape, vecC, sigma, dfct, w), window, order, token)
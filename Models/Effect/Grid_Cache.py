@@ -0,0 +1,103 @@
+import numpy as np
+
+from Models.Cache import LRUCache
+from Models.Precision import get_working_dtype
+
+grid_cache = LRUCache(1024 ** 3)
+# displacement in pixels under which the localized effects leave a pixel as it is
+SUPPORT_TOLERANCE = 1e-3
+
+
+def frozen(*arrays):
+    for a in arrays:
+        a.setflags(write=False)
+    return arrays[0] if len(arrays) == 1 else arrays
+
+
+def cached_grid(key, factory):
+    return grid_cache.get_or_create(key, factory)
+
+
+def crop(arrays, window):
+    r0, r1, c0, c1 = window
+    if isinstance(arrays, tuple):
+        return tuple(a[..., r0:r1, c0:c1] for a in arrays)
+    return arrays[..., r0:r1, c0:c1]
+
+
+def windowed_grid(key, shape, window, planes, build):
+    # build(window) computes a grid over a (r0, r1, c0, c1) window of an image of the given shape,
+    # full grids are cached and sliced as long as they fit comfortably in the cache budget.
+    # The window may also be a (2, ...) array of explicit sample points, those grids are never cached
+    m, n = shape[:2]
+    if isinstance(window, np.ndarray):
+        grid = build(window)
+        return grid[0] if len(grid) == 1 else grid
+    full = (0, m, 0, n)
+    if window is None or tuple(window) == full:
+        return cached_grid(key, lambda: frozen(*build(full)))
+    if planes * get_working_dtype().itemsize * m * n <= grid_cache.budget // 4:
+        return crop(cached_grid(key, lambda: frozen(*build(full))), window)
+    grid = build(window)
+    return grid[0] if len(grid) == 1 else grid
+
+
+def base_grid(shape, window=None):
+    m, n = shape[:2]
+
+    def build(window):
+        if isinstance(window, np.ndarray):
+            return (window,)
+        r0, r1, c0, c1 = window
+        v, u = np.meshgrid(np.arange(r0, r1), np.arange(c0, c1), indexing="ij")
+        return (np.stack((v, u)).astype(get_working_dtype()),)
+
+    return windowed_grid(("base", m, n, get_working_dtype().str), shape, window, 2, build)
+
+
+def polar_grid(shape, center, window=None):
+    m, n = shape[:2]
+    c = (float(center[0]), float(center[1]))
+
+    def build(window):
+        diff = base_grid(shape, window) - np.reshape(c, (2, 1, 1)).astype(get_working_dtype())
+        r = np.sqrt(diff[0] ** 2 + diff[1] ** 2)
+        return diff, r
+
+    return windowed_grid(("polar", m, n, c, get_working_dtype().str), shape, window, 3, build)
+
+
+def angle_grid(shape, center, window=None):
+    m, n = shape[:2]
+    c = (float(center[0]), float(center[1]))
+
+    def build(window):
+        diff, _ = polar_grid(shape, c, window)
+        return (np.arctan2(diff[0], diff[1]),)
+
+    return windowed_grid(("angle", m, n, c, get_working_dtype().str), shape, window, 1, build)
+
+
+def support_radius(displacement, reach, samples=8192, peak=None):
+    # radius from which on displacement(radius) stays under SUPPORT_TOLERANCE, sampled from 0 to reach.
+    # A displacement that only decreases past peak is sampled up to where it has dropped under the tolerance,
+    # a reach far beyond the bump would leave the samples too sparse to see it
+    if peak is not None:
+        bound = max(float(peak), 1.0)
+        while bound < reach and displacement(bound) >= SUPPORT_TOLERANCE:
+            bound *= 2
+        reach = min(reach, bound)
+    r = np.linspace(0, reach, samples)
+    above = np.nonzero(displacement(r) >= SUPPORT_TOLERANCE)[0]
+    if len(above) == 0:
+        return 0.0
+    return min(r[above[-1]] + reach / (samples - 1), reach)
+
+
+def support_window(shape, center, radius):
+    # (r0, r1, c0, c1) of the pixels at most radius away from center along both axes, empty if there are none
+    m, n = shape[:2]
+    y, x = float(center[0]), float(center[1])
+    r0, r1 = int(np.clip(np.ceil(y - radius), 0, m)), int(np.clip(np.floor(y + radius) + 1, 0, m))
+    c0, c1 = int(np.clip(np.ceil(x - radius), 0, n)), int(np.clip(np.floor(x + radius) + 1, 0, n))
+    return r0, max(r0, r1), c0, max(c0, c1)
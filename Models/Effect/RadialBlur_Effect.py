@@ -1,56 +1,114 @@
 import numpy as np
 import scipy.ndimage as img
 
+from Models.Cache import LRUCache, cached_for
+from Models.Cancellation import check
+from Models.Effect.Grid_Cache import cached_grid, frozen
+from Models.Effect.Resample import Resample
+from Models.Precision import clip_unit, get_working_dtype
+from Models.Profiler import profiler
+from Models.Tiling import row_bands, run_tiles
 
-def to_r(f, m, n, rmax, pmax):
-    rs, phis = np.meshgrid(np.linspace(0, rmax, n),
-                           np.linspace(0, pmax, m), sparse=True)
+# polar images of the sources blurred lately, moving the sigma slider only re-runs the blur and the inverse resample
+polar_cache = LRUCache(512 * 1024 ** 2)
+# fraction of the image resolution the polar image of a preview has
+RADIAL_PREVIEW_SCALE = 0.5
 
-    xs, ys = rs * np.cos(phis), rs * np.sin(phis)
-    xs, ys = xs.reshape(-1), ys.reshape(-1)
 
-    coord = np.vstack((ys, xs))
+def to_r_grid(shape, m, n, rmax, pmax):
+    def build():
+        rs, phis = np.meshgrid(np.linspace(0, rmax, n),
+                               np.linspace(0, pmax, m), sparse=True)
 
-    vecC = np.array([f.shape[0] // 2, f.shape[1] // 2]).reshape(2, 1)
-    coord += vecC
+        xs, ys = rs * np.cos(phis), rs * np.sin(phis)
+        xs, ys = xs.reshape(-1), ys.reshape(-1)
 
-    g = img.map_coordinates(f, coord, order=3)
-    g = g.reshape(m, n)
+        coord = np.vstack((ys, xs))
 
-    return np.flipud(g)
+        vecC = np.array([shape[0] // 2, shape[1] // 2]).reshape(2, 1)
+        coord += vecC
+        # rows of the upside down image, so the source array itself is resampled (and its coefficients cached)
+        coord[0] = shape[0] - 1 - coord[0]
+        return frozen(coord.astype(get_working_dtype()))
+
+    return cached_grid(("to_r", tuple(shape[:2]), m, n, rmax, pmax, get_working_dtype().str), build)
+
+
+def from_r_grid(shape, pm, pn, rmax, pmax):
+    # image pixels -> (angle, radius) indices of a pm x pn polar image
+    m, n = shape[:2]
+
+    def build():
+        xs, ys = np.meshgrid(np.arange(n), np.arange(m), sparse=True)
+
+        xs -= n // 2
+        ys -= m // 2
+
+        rs, phis = np.sqrt(xs ** 2 + ys ** 2), np.arctan2(ys, xs)
+        phis += np.pi
+
+        rs, phis = rs.reshape(-1), phis.reshape(-1)
 
+        iis = phis / pmax * (pm - 1)
+        jjs = rs / rmax * (pn - 1)
+        return frozen(np.vstack((iis, jjs)).astype(get_working_dtype()))
 
-def from_r(g, m, n, rmax, pmax):
-    xs, ys = np.meshgrid(np.arange(n), np.arange(m), sparse=True)
+    return cached_grid(("from_r", m, n, pm, pn, rmax, pmax, get_working_dtype().str), build)
 
-    xs -= n // 2
-    ys -= m // 2
 
-    rs, phis = np.sqrt(xs ** 2 + ys ** 2), np.arctan2(ys, xs)
-    phis += np.pi
+def to_r(f, m, n, rmax, pmax, order=3, token=None):
+    coord = to_r_grid(f.shape, m, n, rmax, pmax)
 
-    rs, phis = rs.reshape(-1), phis.reshape(-1)
+    g = Resample(f, coord, order=order, token=token)
+    g = g.reshape((m, n) + f.shape[2:])
 
-    iis = phis / pmax * (m - 1)
-    jjs = rs / rmax * (n - 1)
-    coord = np.vstack((iis, jjs))
+    return np.flipud(g)
+
+
+def cached_to_r(f, m, n, rmax, pmax, order=3, token=None):
+    # the polar image only depends on the source, a sigma change reuses it
+    def build():
+        g = to_r(f, m, n, rmax, pmax, order, token)
+        g.setflags(write=False)
+        return g
+
+    return cached_for(polar_cache, f, (m, n, order), build)
 
-    h = img.map_coordinates(g, coord, order=3)
-    h = h.reshape(m, n)
+
+def from_r(g, shape, rmax, pmax, order=3, token=None):
+    m, n = shape[:2]
+    coord = from_r_grid(shape, g.shape[0], g.shape[1], rmax, pmax)
+
+    h = Resample(g, coord, order=order, token=token, cache=False)
+    h = h.reshape((m, n) + g.shape[2:])
 
     return np.fliplr(np.flipud(h))
 
 
-def RadialBlur_Effect(arrF, sigma):
-    arrF = np.flipud(arrF)
-    m, n = arrF.shape
+def polar_shape(shape, order, polar_scale=None):
+    # previews (order < 3) blur a half resolution polar image unless a scale is given
+    if polar_scale is None:
+        polar_scale = 1.0 if order >= 3 else RADIAL_PREVIEW_SCALE
+    return max(2, int(round(shape[0] * polar_scale))), max(2, int(round(shape[1] * polar_scale)))
+
+
+def RadialBlur_Effect(arrF, sigma, order=3, polar_scale=None, token=None):
+    m, n = arrF.shape[:2]
+    pm, pn = polar_shape(arrF.shape, order, polar_scale)
 
     rmax = np.sqrt((m / 2) ** 2 + (n / 2) ** 2)
     pmax = 2 * np.pi
 
-    arrG = to_r(arrF, m, n, rmax, pmax)
-    blurred_arrG = img.gaussian_filter1d(arrG, sigma=sigma, axis=0, mode="wrap")
+    arrG = cached_to_r(arrF, pm, pn, rmax, pmax, order, token)
+    check(token)
+    blurred_arrG = np.empty(arrG.shape, dtype=arrG.dtype)
+    # the blur runs along the angle axis, bands of radius columns are independent; sigma is in angle samples
+    # of the full resolution polar image
+    with profiler.span("polar blur"):
+        run_tiles(lambda cols: img.gaussian_filter1d(arrG[:, cols[0]:cols[1]], sigma=sigma * pm / m, axis=0,
+                                                     mode="wrap", output=blurred_arrG[:, cols[0]:cols[1]]),
+                  row_bands(pn, pm), token)
 
-    arrH = from_r(blurred_arrG, m, n, rmax, pmax)
+    arrH = from_r(blurred_arrG, arrF.shape, rmax, pmax, order, token)
 
-    return np.clip(arrH, 0, 1)
+    return clip_unit(arrH)
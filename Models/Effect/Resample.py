@@ -0,0 +1,218 @@
+import numpy as np
+import scipy.ndimage as img
+
+from Models.Cache import LRUCache, cached_for
+from Models.Cancellation import check
+from Models.Precision import clip_unit, get_working_dtype
+from Models.Profiler import profiler
+from Models.Tiling import channels_of, row_bands, run_tiles
+
+# map_coordinates orders: nearest and bilinear for interactive previews, cubic for the final render
+INTERPOLATION = {"nearest": 0, "bilinear": 1, "cubic": 3}
+# spline coefficients of the images resampled lately, renders of the same image with other parameters skip the prefilter
+coefficient_cache = LRUCache(512 * 1024 ** 2)
+
+# from this many planes on (frames x channels of a folded stack), the interpolation weights of every output
+# pixel are computed once and applied to all planes together, instead of map_coordinates once per plane
+SHARED_WEIGHTS_PLANES = 12
+# coefficients added around the image, covering the cubic support of the points on the border
+SPLINE_PAD = 2
+
+
+def prefilter(arrF, order, token=None):
+    channels = channels_of(arrF)
+    if order <= 1:
+        return channels
+    return run_tiles(lambda c: img.spline_filter(c, order, output=get_working_dtype(), mode="constant"), channels, token)
+
+
+def cached_prefilter(arrF, order, token=None):
+    if order <= 1:
+        return channels_of(arrF)
+
+    def build():
+        coefficients = prefilter(arrF, order, token)
+        for c in coefficients:
+            c.setflags(write=False)
+        return coefficients
+
+    return cached_for(coefficient_cache, arrF, (order,), build)
+
+
+def interpolation_order(quality):
+    # "nearest", "bilinear", "cubic" or a spline order
+    if isinstance(quality, str):
+        if quality not in INTERPOLATION:
+            raise ValueError("Unknown interpolation: %s, expected one of: %s" % (quality, ", ".join(INTERPOLATION)))
+        return INTERPOLATION[quality]
+    return int(quality)
+
+
+def spline_weights(t, order):
+    # B-spline weights of the order + 1 coefficients from floor(coordinate) - (order - 1) // 2 on
+    if order not in (1, 3):
+        raise ValueError("Only bilinear and cubic spline weights are implemented, got order %s" % order)
+    if order == 1:
+        return [1 - t, t]
+    t2, t3 = t * t, t * t * t
+    return [(1 - t) ** 3 / 6, (3 * t3 - 6 * t2 + 4) / 6, (-3 * t3 + 3 * t2 + 3 * t + 1) / 6, t3 / 6]
+
+
+def Warp_Planes(arrF, build, shape, order=3, token=None):
+    # Warp of an (H, W, K) image: the indices and weights of each output pixel are computed once per band and
+    # gather the K contiguous values of its source pixels at once. Same result as map_coordinates with mode="constant"
+    m, n, k = arrF.shape
+    dtype = get_working_dtype()
+    coefficients = arrF
+    with profiler.span("prefilter"):
+        if order == 3:
+            # the coefficients spline_filter(mode="constant") computes plane by plane
+            coefficients = img.spline_filter1d(coefficients, order, axis=0, output=dtype, mode="mirror")
+            coefficients = img.spline_filter1d(coefficients, order, axis=1, output=dtype, mode="mirror")
+        padded = np.pad(coefficients, ((SPLINE_PAD, SPLINE_PAD), (SPLINE_PAD, SPLINE_PAD), (0, 0)), mode="reflect")
+    check(token)
+    flat = padded.reshape(-1, k)
+    width = n + 2 * SPLINE_PAD
+    offset = SPLINE_PAD - (order - 1) // 2
+
+    arrG = np.empty(shape + (k,), dtype=dtype)
+
+    def band(rows):
+        r0, r1 = rows
+        with profiler.span("coordinates"):
+            y, x = build(r0, r1).reshape(2, -1)
+        inside = (y >= 0) & (y <= m - 1) & (x >= 0) & (x <= n - 1)
+        fy, fx = np.floor(y), np.floor(x)
+        wy, wx = spline_weights((y - fy).astype(dtype), order), spline_weights((x - fx).astype(dtype), order)
+        # points outside are clipped to valid indices, their output is zeroed below
+        iy = np.clip(fy, 0, m - 1).astype(np.intp) + offset
+        ix = np.clip(fx, 0, n - 1).astype(np.intp) + offset
+
+        with profiler.span("interpolation"):
+            output = arrG[r0:r1].reshape(-1, k)
+            output.fill(0)
+            row, term = np.empty_like(output), np.empty_like(output)
+            for i in range(order + 1):
+                start = (iy + i) * width + ix
+                row.fill(0)
+                for j in range(order + 1):
+                    np.take(flat, start + j, axis=0, out=term)
+                    term *= wx[j][:, None]
+                    row += term
+                row *= wy[i][:, None]
+                output += row
+            output[~inside] = 0
+
+    run_tiles(band, row_bands(shape[0], int(np.prod(shape[1:])) * k), token)
+    return arrG
+
+
+def Warp(arrF, build, shape=None, order=3, token=None, cache=True):
+    # build(r0, r1) returns the source coordinates of the output rows r0:r1,
+    # cache=False for temporary sources whose coefficients would only crowd the cache
+    shape = arrF.shape[:2] if shape is None else tuple(shape)
+    if arrF.ndim == 3 and arrF.shape[2] >= SHARED_WEIGHTS_PLANES and order in (1, 3):
+        return Warp_Planes(arrF, build, shape, order, token)
+    with profiler.span("prefilter"):
+        coefficients = cached_prefilter(arrF, order, token) if cache else prefilter(arrF, order, token)
+
+    arrG = np.empty(shape + arrF.shape[2:], dtype=get_working_dtype())
+    outputs = [arrG] if arrF.ndim == 2 else [arrG[..., i] for i in range(arrF.shape[2])]
+
+    def band(rows):
+        r0, r1 = rows
+        with profiler.span("coordinates"):
+            matX = build(r0, r1)
+        # the same coordinate map is applied to every channel (including alpha)
+        with profiler.span("interpolation"):
+            for c, output in zip(coefficients, outputs):
+                img.map_coordinates(c, matX, output=output[r0:r1], order=order, prefilter=False)
+
+    run_tiles(band, row_bands(shape[0], int(np.prod(shape[1:]))), token)
+    return arrG
+
+
+def Resample(arrF, matX, order=3, token=None, cache=True):
+    return Warp(arrF, lambda r0, r1: matX[:, r0:r1], matX.shape[1:], order, token, cache)
+
+
+def Warp_Window(arrF, build, window=None, order=3, token=None):
+    # clipped warp where build(window) returns the source coordinates of a (r0, r1, c0, c1) window of the output.
+    # Only the given window is resampled, the map must be the identity around it and the source is copied there
+    m, n = arrF.shape[:2]
+    r0, r1, c0, c1 = (0, m, 0, n) if window is None else window
+    if (r0, r1, c0, c1) == (0, m, 0, n):
+        return clip_unit(Warp(arrF, lambda a, b: build((a, b, 0, n)), order=order, token=token))
+
+    with profiler.span("copy"):
+        arrG = np.clip(arrF, 0, 1).astype(get_working_dtype(), copy=False)
+    if r1 > r0 and c1 > c0:
+        arrG[r0:r1, c0:c1] = clip_unit(Warp(arrF, lambda a, b: build((r0 + a, r0 + b, c0, c1)), (r1 - r0, c1 - c0),
+                                            order, token))
+    return arrG
+
+
+def reflect_index(i, n):
+    # coefficient indices beyond the edges, mirrored like the padding of Warp_Planes
+    i = np.abs(i)
+    return np.clip(np.where(i > n - 1, 2 * (n - 1) - i, i), 0, n - 1)
+
+
+def Warp_Rows(arrF, y, x0, shape, order=3, token=None):
+    # Warp whose output row v samples the source row y[v] at the columns u + x0[v]. The weights are the same along
+    # a row, so the coefficient rows of a band are blended at once and every output row is a weighted sum of shifted
+    # slices of its blended row, no coordinate map is built. Nearest copies shifted source rows.
+    # Same result as Warp with mode="constant"
+    if order not in (0, 1, 3):
+        raise ValueError("Warp_Rows interpolates with nearest, bilinear or cubic splines, got order %s" % order)
+    m, n = arrF.shape[:2]
+    dtype = get_working_dtype()
+    if order > 0:
+        with profiler.span("prefilter"):
+            coefficients = cached_prefilter(arrF, order, token)
+    start = (order - 1) // 2
+
+    arrG = np.zeros(shape + arrF.shape[2:], dtype=dtype)
+    # the columns of every row that sample inside the image, -x0 <= u <= n - 1 - x0, widened by the column
+    # a coordinate map in the working precision rounds onto the edge
+    first = np.clip(np.ceil(-x0.astype(np.float64)), 0, shape[1]).astype(np.intp)
+    last = np.clip(np.floor(n - 1 - x0.astype(np.float64)) + 1, 0, shape[1]).astype(np.intp)
+    first = np.where((first > 0) & ((first - 1).astype(dtype) + x0 >= 0), first - 1, first)
+    last = np.where((last < shape[1]) & (last.astype(dtype) + x0 <= n - 1), last + 1, last)
+    rows_inside = (y >= 0) & (y <= m - 1) & (first < last)
+
+    def band(rows):
+        r0, r1 = rows
+        v = r0 + np.nonzero(rows_inside[r0:r1])[0]
+        with profiler.span("interpolation"):
+            if order == 0:
+                # whole pixel shifts, rounded half up like map_coordinates
+                iy, ix = np.floor(y[v] + 0.5).astype(np.intp), np.floor(x0[v] + 0.5).astype(np.intp)
+                for row, sy, sx in zip(v, iy, ix):
+                    arrG[row, first[row]:last[row]] = arrF[sy, first[row] + sx:last[row] + sx]
+                return
+
+            fy, fx = np.floor(y[v]), np.floor(x0[v])
+            wy = spline_weights((y[v] - fy).astype(dtype), order)
+            wx = spline_weights((x0[v] - fx).astype(dtype), order)
+            iy = [reflect_index(fy.astype(np.intp) - start + i, m) for i in range(order + 1)]
+            blended = np.empty((len(v), n) + arrF.shape[2:], dtype=dtype)
+            planes = [blended] if arrF.ndim == 2 else [blended[..., i] for i in range(arrF.shape[2])]
+            for c, plane in zip(coefficients, planes):
+                np.multiply(c[iy[0]], wy[0][:, None], out=plane)
+                for i in range(1, order + 1):
+                    plane += c[iy[i]] * wy[i][:, None]
+            pad = ((0, 0), (SPLINE_PAD, SPLINE_PAD)) + ((0, 0),) * (arrF.ndim - 2)
+            blended = np.pad(blended, pad, mode="reflect" if n > 1 else "edge")
+
+            # blended column u + fx - start + j of the padded row
+            shift = fx.astype(np.intp) - start + SPLINE_PAD
+            for k, row in enumerate(v):
+                u0, u1, s = first[row], last[row], shift[k]
+                output = arrG[row, u0:u1]
+                np.multiply(blended[k, u0 + s:u1 + s], wx[0][k], out=output)
+                for j in range(1, order + 1):
+                    output += blended[k, u0 + s + j:u1 + s + j] * wx[j][k]
+
+    run_tiles(band, row_bands(shape[0], int(np.prod(shape[1:]))), token)
+    return arrG
@@ -1,21 +1,33 @@
 import numpy as np
-import scipy.ndimage as img
+
+from Models.Effect.Grid_Cache import base_grid, polar_grid, support_radius, support_window
+from Models.Effect.Resample import Warp_Window
 
 
 def lp(matX, p):
     return np.power(np.sum(np.power(np.abs(matX), p), axis=0), 1 / p)
 
 
-def SquareEye_Effect(arrF, vecC, sigma, p):
-    vecC = np.array(vecC).reshape(-1, 1)
-    m, n = arrF.shape
-    u, v = np.meshgrid(np.arange(n), np.arange(m))
+def SquareEye_Map(shape, vecC, sigma, p, window=None):
+    diff, _ = polar_grid(shape, vecC, window)
+    return base_grid(shape, window) - diff * np.exp(-lp(diff, p) ** 2 / (2 * sigma ** 2))
+
+
+def SquareEye_Support(shape, vecC, sigma, p):
+    # a pixel at lp distance d moves by at most k * d * exp(-d^2 / (2 sigma^2)), k bounding its euclidean distance.
+    # Both coordinates of the offset are at most d, so the lp ball is inside a square of the same radius
+    if sigma == 0:
+        return None
+    m, n = shape[:2]
+    corners = np.array([[y - vecC[0], x - vecC[1]] for y in (0, m - 1) for x in (0, n - 1)], dtype=float).T
+    k = max(1.0, 2 ** (0.5 - 1 / p))
+    # the corners are millions of pixels away in the lp norm for p < 1, the bump at d = sigma bounds the search
+    radius = support_radius(lambda d: k * d * np.exp(-d ** 2 / (2 * sigma ** 2)), float(lp(corners, p).max()),
+                            peak=abs(sigma))
+    return support_window(shape, vecC, radius)
 
-    matX = np.vstack((v.flatten(), u.flatten())).astype(float)
-    matR = vecC - matX
-    matX += matR * np.exp(-lp(matR, p) ** 2 / (2 * sigma ** 2))
 
-    arrG = img.map_coordinates(arrF, matX)
-    arrG = arrG.reshape(m,n)
+def SquareEye_Effect(arrF, vecC, sigma, p, order=3, token=None):
+    window = SquareEye_Support(arrF.shape, vecC, sigma, p)
 
-    return np.clip(arrG, 0, 1)
+    return Warp_Window(arrF, lambda w: SquareEye_Map(arrF.shape, vecC, sigma, p, w), window, order, token)
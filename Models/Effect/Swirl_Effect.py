@@ -1,26 +1,55 @@
 import numpy as np
-import scipy.ndimage as img
 
+from Models.Effect.Grid_Cache import polar_grid, support_radius, support_window, windowed_grid
+from Models.Effect.Resample import Warp_Window
+from Models.Precision import get_working_dtype
 
-def Swirl_Effect(arrF, vecC, sigma, mag):
-    m, n = arrF.shape
-    u, v = np.meshgrid(np.arange(n), np.arange(m))
-    matX = np.stack((v, u)).astype(float)
 
-    vecC = np.asarray(vecC).reshape(2, 1, 1)
-    diff = matX - vecC
-    r = np.linalg.norm(diff, axis=0)
-    angle = np.arctan2(diff[1], diff[0])
+def swirl_rmax(shape, c):
+    # the largest radius is reached at one of the corners
+    m, n = shape[:2]
+    return float(max(np.sqrt((y - c[0]) ** 2 + (x - c[1]) ** 2) for y in (0, m - 1) for x in (0, n - 1)))
 
-    dist = r / r.max()
-    gaussian = np.exp(-dist ** 2 / (2 * (sigma ** 2)))
 
-    angle += mag * gaussian
+def swirl_grid(shape, vecC, window=None):
+    m, n = shape[:2]
+    c = (float(vecC[0]), float(vecC[1]))
+    rmax = swirl_rmax(shape, c)
+
+    def build(window):
+        diff, r = polar_grid(shape, c, window)
+        angle = np.arctan2(diff[1], diff[0])
+        dist = r / rmax
+        return angle, dist ** 2
+
+    return windowed_grid(("swirl", m, n, c, get_working_dtype().str), shape, window, 2, build)
+
+
+def Swirl_Map(shape, vecC, sigma, mag, window=None):
+    _, r = polar_grid(shape, vecC, window)
+    angle, dist2 = swirl_grid(shape, vecC, window)
+
+    gaussian = np.exp(-dist2 / (2 * (sigma ** 2)))
+    angle = angle + mag * gaussian
 
     matX = np.stack([r * np.cos(angle), r * np.sin(angle)])
-    matX += vecC
+    matX += np.asarray(vecC, dtype=get_working_dtype()).reshape(2, 1, 1)
+    return matX
+
+
+def Swirl_Support(shape, vecC, sigma, mag):
+    # a pixel at radius r turns by mag * gaussian(r / rmax), which moves it by 2 r |sin(angle / 2)| pixels
+    if sigma == 0:
+        return None
+    rmax = swirl_rmax(shape, (float(vecC[0]), float(vecC[1])))
+    if rmax == 0:
+        return None
+    radius = support_radius(lambda r: 2 * r * np.abs(np.sin(mag * np.exp(-(r / rmax) ** 2 / (2 * sigma ** 2)) / 2)),
+                            rmax)
+    return support_window(shape, vecC, radius)
+
 
-    arrG = img.map_coordinates(arrF, matX)
-    arrG = arrG.reshape(m, n)
+def Swirl_Effect(arrF, vecC, sigma, mag, order=3, token=None):
+    window = Swirl_Support(arrF.shape, vecC, sigma, mag)
 
-    return np.clip(arrG, 0, 1)
+    return Warp_Window(arrF, lambda w: Swirl_Map(arrF.shape, vecC, sigma, mag, w), window, order, token)
@@ -1,20 +1,50 @@
 import numpy as np
-import scipy.ndimage as img
 
+from Models.Effect.Grid_Cache import cached_grid, frozen
+from Models.Effect.Resample import Warp, Warp_Rows
+from Models.Precision import clip_unit, get_working_dtype
 
-def Waves_Effect(arrF, ampl, fre, phase):
-    m, n = arrF.shape
-    u, v = np.meshgrid(np.arange(n + ampl[1] * 2),
-                       np.arange(m + ampl[0] * 2))
-    matX = np.stack((v, u)).astype(float)
 
-    a = ampl[0] * np.sin(matX[0] / fre[1] + phase[0])
-    matX[0] += a - ampl[0]
+def waves_shape(shape, ampl):
+    return int(np.ceil(shape[0] + ampl[0] * 2)), int(np.ceil(shape[1] + ampl[1] * 2))
 
-    b = ampl[1] * np.sin(matX[0] / fre[1] + phase[1])
-    matX[1] += b - ampl[1]
 
-    arrG = img.map_coordinates(arrF, matX)
-    arrG = arrG.reshape(matX.shape[1], matX.shape[2])
+def waves_offsets(v, ampl, fre, phase):
+    # source row and column shift of the output rows v, the waves move whole rows
+    y = v + (ampl[0] * np.sin(v / fre[1] + phase[0]) - ampl[0])
+    return y, ampl[1] * np.sin(y / fre[1] + phase[1]) - ampl[1]
 
-    return np.clip(arrG, 0, 1)
+
+def waves_tables(shape, ampl, fre, phase):
+    # the offsets of every output row, cached by parameters
+    m = waves_shape(shape, ampl)[0]
+    dtype = get_working_dtype()
+    key = ("waves", m, tuple(map(float, ampl)), tuple(map(float, fre)), tuple(map(float, phase)), dtype.str)
+    return cached_grid(key, lambda: frozen(*waves_offsets(np.arange(m, dtype=dtype), ampl, fre, phase)))
+
+
+def Waves_Map(shape, ampl, fre, phase, window=None):
+    if isinstance(window, np.ndarray):
+        y, x0 = waves_offsets(window[0], ampl, fre, phase)
+        return np.stack([y, window[1] + x0])
+
+    m, n = waves_shape(shape, ampl)
+    r0, r1, c0, c1 = (0, m, 0, n) if window is None else window
+    y, x0 = waves_tables(shape, ampl, fre, phase)
+    matX = np.empty((2, r1 - r0, c1 - c0), dtype=get_working_dtype())
+    matX[0] = y[r0:r1, None]
+    np.add(np.arange(c0, c1, dtype=matX.dtype), x0[r0:r1, None], out=matX[1])
+    return matX
+
+
+def Waves_Effect(arrF, ampl, fre, phase, order=3, token=None):
+    shape = waves_shape(arrF.shape, ampl)
+    if order in (0, 1, 3):
+        y, x0 = waves_tables(arrF.shape, ampl, fre, phase)
+        arrG = Warp_Rows(arrF, y, x0, shape, order, token)
+    else:
+        # the other spline orders go through map_coordinates
+        arrG = Warp(arrF, lambda r0, r1: Waves_Map(arrF.shape, ampl, fre, phase, (r0, r1, 0, shape[1])), shape,
+                    order, token)
+
+    return clip_unit(arrG)
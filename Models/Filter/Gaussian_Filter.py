@@ -1,13 +1,98 @@
+from functools import lru_cache
+
 import numpy as np
-from PIL import Image, ImageFilter
+from scipy.ndimage import gaussian_filter1d
+from scipy.signal import lfilter, lfiltic
+
+from Models.Filter.Integral_Image import Box_Gaussian
+from Models.Precision import clip_unit, get_working_dtype
+from Models.Profiler import profiler
+from Models.Tiling import row_bands, run_tiles
+
+# from this radius on the recursive filter, whose cost does not depend on the radius, is faster
+GAUSSIAN_RECURSIVE_RADIUS = 6
+
+
+@lru_cache(maxsize=64)
+def recursive_filter(sigma):
+    # Young and van Vliet, "Recursive implementation of the Gaussian filter" (1995)
+    if sigma >= 2.5:
+        q = 0.98711 * sigma - 0.96330
+    else:
+        q = 3.97156 - 4.14554 * np.sqrt(1 - 0.26891 * sigma)
+    b0 = 1.57825 + 2.44413 * q + 1.4281 * q ** 2 + 0.422205 * q ** 3
+    b1 = 2.44413 * q + 2.85619 * q ** 2 + 1.26661 * q ** 3
+    b2 = -(1.4281 * q ** 2 + 1.26661 * q ** 3)
+    b3 = 0.422205 * q ** 3
+    b = np.array([1 - (b1 + b2 + b3) / b0])
+    a = np.array([1, -b1 / b0, -b2 / b0, -b3 / b0])
+
+    # the anti-causal pass has to start as if the causal one had gone on over the replicated edge value
+    # (Triggs and Sdika, 2006), its last outputs are that edge value plus edge @ (last causal outputs - edge value)
+    tail = int(10 * sigma) + 50
+    edge = np.empty((3, 3))
+    for k in range(3):
+        forward = lfilter(b, a, np.zeros(tail), zi=lfiltic(b, a, np.eye(3)[k]))[0]
+        edge[:, k] = lfilter(b, a, forward[::-1])[::-1][:3]
+
+    # lfilter states from the last three outputs, most recent first
+    state = np.stack([lfiltic(b, a, y) for y in np.eye(3)], axis=1)
+    return b, a, edge, state
+
 
+def recursive_gaussian1d(arrF, sigma, axis, output):
+    # a causal and an anti-causal pass, with the image edges replicated ("nearest" border). Both run in float64:
+    # the poles get close to 1 for large sigmas and in float32 the gain of flat areas drifts by up to 1%
+    b, a, edge, state = recursive_filter(float(sigma))
 
-def Gaussian_Filter(arrF, radius):
+    first = np.moveaxis(np.take(arrF, [0], axis=axis), axis, 0)
+    zi = np.tensordot(state.sum(axis=1), first, axes=0)[:, 0]
+    forward, _ = lfilter(b, a, arrF, axis=axis, zi=np.moveaxis(zi, 0, axis))
+
+    last = np.moveaxis(np.take(arrF, [-1], axis=axis), axis, 0)
+    outputs = np.moveaxis(np.take(forward, [-1, -2, -3], axis=axis), axis, 0) - last
+    y = np.tensordot(edge, outputs, axes=1) + last
+    zi = np.tensordot(state, y, axes=1)
+    backward, _ = lfilter(b, a, np.flip(forward, axis=axis), axis=axis, zi=np.moveaxis(zi, 0, axis))
+    output[...] = np.flip(backward, axis=axis)
+
+
+def gaussian1d(arrF, sigma, axis, output, method):
+    # the edge of the recursive filter is set from the last three samples, shorter axes take the sampled kernel
+    if method == "recursive" and arrF.shape[axis] >= 3:
+        recursive_gaussian1d(arrF, sigma, axis, output)
+    else:
+        gaussian_filter1d(arrF, sigma, axis=axis, output=output, mode="nearest")
+
+
+def Gaussian_Filter(arrF, radius, method="auto", token=None):
+    # method: "exact" (sampled kernel), "recursive" (IIR, cost independent of the radius),
+    # "box" (three box means from summed-area tables) or "auto"
     if radius <= 0:
         return arrF
-    arrG = Image.fromarray((arrF * 255).astype(np.uint8)).convert(mode="L")
 
-    output = arrG.filter(ImageFilter.GaussianBlur(radius=radius))
-    output = np.array(output) / 255.0
+    if method == "auto":
+        method = "recursive" if radius >= GAUSSIAN_RECURSIVE_RADIUS else "exact"
+    if method not in ("exact", "recursive", "box"):
+        raise ValueError("Unknown gaussian method: %s" % method)
+    if method == "box":
+        arrG = Box_Gaussian(arrF, radius, token=token)
+        return np.clip(arrG, 0, 1)
+    if radius < 0.5:
+        # the recursive coefficients are only defined from sigma 0.5 on
+        method = "exact"
+
+    m, n = arrF.shape[:2]
+    channels = arrF[:1, :1].size
+    arrT = np.empty(arrF.shape, dtype=get_working_dtype())
+    arrG = np.empty(arrF.shape, dtype=get_working_dtype())
+
+    # separable: the vertical pass on bands of columns, the horizontal one on bands of rows, all channels at once
+    with profiler.span("vertical pass", method=method):
+        run_tiles(lambda cols: gaussian1d(arrF[:, cols[0]:cols[1]], radius, 0, arrT[:, cols[0]:cols[1]], method),
+                  row_bands(n, m * channels), token)
+    with profiler.span("horizontal pass", method=method):
+        run_tiles(lambda rows: gaussian1d(arrT[rows[0]:rows[1]], radius, 1, arrG[rows[0]:rows[1]], method),
+                  row_bands(m, n * channels), token)
 
-    return np.clip(output, 0, 1)
+    return clip_unit(arrG)
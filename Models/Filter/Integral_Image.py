@@ -0,0 +1,70 @@
+import numpy as np
+
+from Models.Cache import LRUCache, cached_for
+from Models.Precision import get_working_dtype
+from Models.Profiler import profiler
+from Models.Tiling import row_bands, run_tiles
+
+# summed-area tables of the images filtered lately, every window size is served from the same table
+table_cache = LRUCache(1024 ** 3)
+
+
+def integral_image(arrF, token=None):
+    # float64 summed-area table with a leading row and column of zeros, table[y, x] = arrF[:y, :x].sum()
+    m, n = arrF.shape[:2]
+    channels = arrF[:1, :1].size
+    with profiler.span("summed-area table"):
+        table = np.zeros((m + 1, n + 1) + arrF.shape[2:], dtype=np.float64)
+
+        run_tiles(lambda cols: np.cumsum(arrF[:, cols[0]:cols[1]], axis=0, dtype=np.float64,
+                                         out=table[1:, 1 + cols[0]:1 + cols[1]]), row_bands(n, m * channels), token)
+        run_tiles(lambda rows: np.cumsum(table[1 + rows[0]:1 + rows[1], 1:], axis=1,
+                                         out=table[1 + rows[0]:1 + rows[1], 1:]), row_bands(m, n * channels), token)
+    return table
+
+
+def cached_integral_image(arrF, token=None):
+    return cached_for(table_cache, arrF, (), lambda: integral_image(arrF, token))
+
+
+def Box_Mean(arrF, size, table=None, token=None):
+    # mean over a size x size window with zeros outside the image, window offsets -(size // 2) .. size - size // 2 - 1
+    m, n = arrF.shape[:2]
+    table = cached_integral_image(arrF, token) if table is None else table
+
+    rows = np.arange(m)
+    y0, y1 = np.clip(rows - size // 2, 0, m), np.clip(rows + size - size // 2, 0, m)
+    # replicating the first and last table columns turns the clipped column indices into two slices
+    pad = ((0, 0), (size // 2, size - size // 2 - 1)) + ((0, 0),) * (arrF.ndim - 2)
+
+    arrG = np.empty(arrF.shape, dtype=get_working_dtype())
+
+    def band(tile):
+        r0, r1 = tile
+        strip = np.pad(table[y1[r0:r1]] - table[y0[r0:r1]], pad, mode="edge")
+        np.divide(strip[:, size:size + n] - strip[:, :n], size * size, out=arrG[r0:r1], casting="unsafe")
+
+    with profiler.span("box mean", size=size):
+        run_tiles(band, row_bands(m, arrF[:1].size), token)
+    return arrG
+
+
+def box_sizes(sigma, passes=3):
+    # odd box widths whose repeated application has the variance of a gaussian of the given sigma
+    ideal = np.sqrt(12 * sigma ** 2 / passes + 1)
+    lower = int(np.floor(ideal))
+    if lower % 2 == 0:
+        lower -= 1
+    count = round((12 * sigma ** 2 - passes * lower ** 2 - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+    return [lower if i < count else lower + 2 for i in range(passes)]
+
+
+def Box_Gaussian(arrF, sigma, passes=3, token=None):
+    # repeated box means approximate a gaussian, the edges are replicated like the other gaussian engines
+    for size in box_sizes(sigma, passes):
+        r = size // 2
+        if r == 0:
+            continue
+        padded = np.pad(arrF, ((r, r), (r, r)) + ((0, 0),) * (arrF.ndim - 2), mode="edge")
+        arrF = Box_Mean(padded, size, integral_image(padded, token), token)[r:-r, r:-r]
+    return arrF
@@ -1,19 +1,13 @@
-import numpy as np
+from Models.Filter.Integral_Image import Box_Mean
+from Models.Precision import clip_unit
 
 
-def MeanFilterRec(arrF, m):
-    f = np.pad(arrF, ((0, 0), (m, m)))
-    f1 = np.roll(f, m // 2 + 1, axis=1)
-    f2 = np.roll(f, -m // 2 + 1, axis=1)
-    g = np.cumsum((-f1 + f2), axis=1)
-    return g[:, m:-m] / m
-
-
-def Mean_Filter(arrF, size):
-    if size <= 0:
+def Mean_Filter(arrF, size, token=None):
+    size = int(size)
+    if size < 1:
         return arrF
 
-    arrG = MeanFilterRec(arrF, int(size)).T
-    arrG = MeanFilterRec(arrG, int(size)).T
+    # the summed-area table of arrF is cached, so other sizes on the same image only read it
+    arrG = Box_Mean(arrF, size, token=token)
 
-    return np.clip(arrG, 0, 1)
+    return clip_unit(arrG)
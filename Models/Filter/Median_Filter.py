@@ -1,12 +1,112 @@
 import numpy as np
 from scipy.ndimage import median_filter
 
+from Models.Precision import clip_unit, get_working_dtype
+from Models.Profiler import profiler
+from Models.Tiling import Filter_Bands
 
-def Median_Filter(arrF, size):
+# from this window size on the histogram engine beats scipy's selection (see benchmark.py --median-crossover)
+MEDIAN_CROSSOVER = 9
+MEDIAN_METHODS = ("auto", "exact", "histogram")
+
+# engine used when the caller does not pass one, the batch CLI sets it for its worker processes
+median_method = "auto"
+
+
+def set_median_method(method):
+    global median_method
+    if method not in MEDIAN_METHODS:
+        raise ValueError("Unknown median method: %s" % method)
+    median_method = method
+
+
+def get_median_method():
+    return median_method
+
+
+def is_quantized(arrF, rows=256):
+    # True if every value is a k/255 level in [0, 1]: the histogram engine is exact on such input
+    if arrF.dtype == np.uint8:
+        return True
+    for r0 in range(0, arrF.shape[0], rows):
+        strip = arrF[r0:r0 + rows]
+        levels = np.round(strip * 255)
+        if levels.min(initial=0) < 0 or levels.max(initial=0) > 255:
+            return False
+        levels /= 255
+        if not np.array_equal(levels, strip):
+            return False
+    return True
+
+
+def MedianHistogram(arrQ, size):
+    # sliding window median of 8 bit data: column histograms are updated by one row per output row, a coarse
+    # (16 bin) window histogram locates the median and only the fine bins of the coarse bins in use are summed
+    h, w = arrQ.shape
+    r = size // 2
+    rank = size * size // 2
+    padded = np.pad(arrQ, r, mode="symmetric")
+    coarse = padded >> 4
+    cols = np.arange(padded.shape[1])
+    index = np.arange(w)
+
+    hist = np.zeros((256, padded.shape[1]), dtype=np.int32)
+    hist_coarse = np.zeros((16, padded.shape[1]), dtype=np.int32)
+    for i in range(size):
+        hist[padded[i], cols] += 1
+        hist_coarse[coarse[i], cols] += 1
+
+    acc = np.zeros((16, padded.shape[1] + 1), dtype=np.int32)
+    acc_coarse = np.zeros((16, padded.shape[1] + 1), dtype=np.int32)
+    output = np.empty((h, w), dtype=np.uint8)
+    for y in range(h):
+        if y > 0:
+            hist[padded[y - 1], cols] -= 1
+            hist_coarse[coarse[y - 1], cols] -= 1
+            hist[padded[y + size - 1], cols] += 1
+            hist_coarse[coarse[y + size - 1], cols] += 1
+
+        # window histograms of every pixel of the row from running sums over the columns
+        np.cumsum(hist_coarse, axis=1, out=acc_coarse[:, 1:])
+        window = acc_coarse[:, size:] - acc_coarse[:, :-size]
+        counts = np.cumsum(window, axis=0)
+        b = np.argmax(counts > rank, axis=0)
+        below = counts[b, index] - window[b, index]
+
+        for block in np.unique(b):
+            pixels = np.flatnonzero(b == block)
+            np.cumsum(hist[block * 16:block * 16 + 16], axis=1, out=acc[:, 1:])
+            counts = np.cumsum(acc[:, pixels + size] - acc[:, pixels], axis=0)
+            counts += below[pixels]
+            output[y, pixels] = block * 16 + np.argmax(counts > rank, axis=0)
+    return output
+
+
+def median_histogram(arrF, size):
+    arrQ = np.round(np.clip(arrF, 0, 1) * 255).astype(np.uint8)
+    arrG = MedianHistogram(arrQ, size).astype(get_working_dtype())
+    arrG /= 255
+    return arrG
+
+
+def Median_Filter(arrF, size, method=None, token=None):
+    # method: "exact" (scipy), "histogram" (8 bit quantized, O(1) in the window size) or "auto", None for the
+    # module default. "auto" only takes the histogram engine on 8 bit input, where it matches scipy exactly
     if size <= 0:
         return arrF
     size = int((size // 2) * 2) + 1
 
-    output = median_filter(arrF, size)
+    method = method or median_method
+    if method == "auto":
+        method = "histogram" if size >= MEDIAN_CROSSOVER and is_quantized(arrF) else "exact"
+    if method == "histogram":
+        fn = lambda a: median_histogram(a, size)
+    elif method == "exact":
+        fn = lambda a: median_filter(a, size)
+    else:
+        raise ValueError("Unknown median method: %s" % method)
+
+    with profiler.span("median bands", method=method):
+        output = Filter_Bands(fn, arrF, size // 2, get_working_dtype(), token)
 
-    return np.clip(output, 0, 1)
+    return clip_unit(output)
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import zlib
+
+import numpy as np
+
+from Models.Cancellation import check
+from Models.Precision import get_working_dtype
+
+
+class Snapshot:
+    # an image quantized to 8 or 16 bits and zlib compressed, kept in memory or spilled to disk
+    def __init__(self, image, bits=16):
+        self.shape = image.shape
+        self.mapped = isinstance(image, np.memmap) and image.filename is not None
+        if self.mapped:
+            # a memory-mapped image already is on disk, the snapshot refers to its file
+            self.data, self.path = None, image.filename
+            return
+        self.dtype = np.uint16 if bits == 16 else np.uint8
+        self.scale = float(np.iinfo(self.dtype).max)
+        quantized = np.round(np.clip(image, 0, 1) * self.scale).astype(self.dtype)
+        self.data = zlib.compress(quantized.tobytes(), 1)
+        self.path = None
+
+    @property
+    def nbytes(self):
+        return 0 if self.data is None else len(self.data)
+
+    def spill(self, directory):
+        fd, self.path = tempfile.mkstemp(suffix=".snapshot", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.data)
+        self.data = None
+
+    def load(self):
+        if self.mapped:
+            return np.load(self.path, mmap_mode="r")
+        data = self.data
+        if data is None:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        quantized = np.frombuffer(zlib.decompress(data), dtype=self.dtype).reshape(self.shape)
+        image = quantized.astype(get_working_dtype())
+        image /= self.scale
+        return image
+
+    def discard(self):
+        if not self.mapped and self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.data = self.path = None
+
+
+class History:
+    # every state is either a keyframe snapshot or an (operation, parameters) record replayed on the previous state
+    def __init__(self, budget=256 * 1024 ** 2, keyframe_interval=4, bits=16):
+        self.budget = budget
+        self.keyframe_interval = keyframe_interval
+        self.bits = bits
+        self.states = []
+        self.index = -1
+        self.current = None
+        self.directory = None
+
+    def __len__(self):
+        return len(self.states)
+
+    @property
+    def labels(self):
+        return [label for label, _, _ in self.states]
+
+    def can_undo(self):
+        return self.index > 0
+
+    def can_redo(self):
+        return self.index < len(self.states) - 1
+
+    def reset(self, label, image):
+        self.truncate(0)
+        self.push(label, image)
+
+    def truncate(self, length):
+        for _, snapshot, _ in self.states[length:]:
+            if snapshot is not None:
+                snapshot.discard()
+        del self.states[length:]
+        self.index = min(self.index, length - 1)
+        if self.current is not None and self.current[0] >= length:
+            self.current = None
+
+    def push(self, label, image, operation=None):
+        # pushing after an undo drops the states that could have been redone
+        self.truncate(self.index + 1)
+
+        since_keyframe = 0
+        for _, snapshot, _ in reversed(self.states):
+            if snapshot is not None:
+                break
+            since_keyframe += 1
+
+        keyframe = (operation is None or not self.states or since_keyframe + 1 >= self.keyframe_interval
+                    or isinstance(image, np.memmap))
+        self.states.append((label, Snapshot(image, self.bits) if keyframe else None, operation))
+        self.index = len(self.states) - 1
+        self.current = (self.index, image)
+        self.enforce_budget()
+
+    def restore(self, index, token=None, progress=None):
+        # the image of a state, loaded from the keyframe before it and replayed. The history itself is left as it
+        # is so this can run on a thread, move() makes the state current
+        current = self.current
+        if current is not None and current[0] == index:
+            return current[1]
+
+        start = index
+        while self.states[start][1] is None:
+            start -= 1
+
+        image = self.states[start][1].load()
+        for i, (_, _, (f, params)) in enumerate(self.states[start + 1:index + 1]):
+            check(token)
+            image = f(image, *params, token=token)
+            if progress is not None:
+                progress(i + 1, index - start)
+        return image
+
+    def move(self, index, image):
+        self.index = index
+        self.current = (index, image)
+
+    def undo(self):
+        if self.can_undo():
+            self.move(self.index - 1, self.restore(self.index - 1))
+        return self.restore(self.index)
+
+    def redo(self):
+        if self.can_redo():
+            self.move(self.index + 1, self.restore(self.index + 1))
+        return self.restore(self.index)
+
+    def memory(self):
+        return sum(snapshot.nbytes for _, snapshot, _ in self.states if snapshot is not None)
+
+    def enforce_budget(self):
+        # the oldest snapshots are moved to disk first
+        used = self.memory()
+        for _, snapshot, _ in self.states:
+            if used <= self.budget:
+                break
+            if snapshot is not None and snapshot.data is not None:
+                if self.directory is None:
+                    self.directory = tempfile.mkdtemp(prefix="ttcs_history_")
+                used -= snapshot.nbytes
+                snapshot.spill(self.directory)
+
+    def close(self):
+        self.truncate(0)
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
@@ -0,0 +1,95 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from Models.Batch import find_images
+from Models.Cache import LRUCache
+from Models.Cancellation import check
+from Models.LargeImage import LARGE_IMAGE_PIXELS, open_large, save_large
+from Models.Precision import from_working, to_working
+
+
+def image_pixels(file_name):
+    # read from the header, nothing is decoded
+    with Image.open(file_name) as image:
+        return image.size[0] * image.size[1]
+
+
+def decode(file_name):
+    # decoded once and turned upright like QImageReader's auto transform did
+    with Image.open(file_name) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("L", "RGB", "RGBA", "I;16"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        return np.asarray(image)
+
+
+def load_image(file_name, directory=None, token=None, progress=None):
+    # (working image, uint8 display frame); an 8 bit image is displayed from the decoded buffer itself.
+    # Large images become memory maps in directory, they are shown through a proxy and their frame is None
+    if image_pixels(file_name) >= LARGE_IMAGE_PIXELS:
+        return open_large(file_name, directory, token, progress), None
+
+    decoded = decode(file_name)
+    check(token)
+    image = to_working(decoded)
+    frame = decoded if decoded.dtype == np.uint8 else from_working(image)
+    # both may be shared by the prefetch cache and the view, nothing may write into them
+    image.setflags(write=False)
+    frame.setflags(write=False)
+    if progress is not None:
+        progress(1, 1)
+    return image, frame
+
+
+def save_image(image, file_name, token=None, progress=None):
+    # converted to 8 bit strip by strip, so memory-mapped images are saved without a float copy in memory
+    save_large(image, file_name, token, progress)
+
+
+def neighbours(file_name, count=1):
+    # (after, before): the images following and preceding file_name in its folder, nearest first
+    files = find_images([os.path.dirname(os.path.abspath(file_name))])
+    if os.path.abspath(file_name) not in files:
+        return [], []
+    i = files.index(os.path.abspath(file_name))
+    return files[i + 1:i + 1 + count], files[max(0, i - count):i][::-1]
+
+
+def nearest_first(after, before):
+    return [f for pair in zip_longest(after, before) for f in pair if f is not None]
+
+
+class Prefetcher:
+    # decoded images by file; the neighbours of the image being viewed are decoded ahead on a background thread,
+    # so browsing to them only waits for a decode that is still running
+    def __init__(self, budget=768 * 1024 ** 2):
+        self.cache = LRUCache(budget)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+    def key(self, file_name):
+        stat = os.stat(file_name)
+        return os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size
+
+    def load(self, file_name, directory=None, token=None, progress=None):
+        if image_pixels(file_name) >= LARGE_IMAGE_PIXELS:
+            return load_image(file_name, directory, token, progress)
+        return self.cache.get_or_create(self.key(file_name), lambda: load_image(file_name, token=token,
+                                                                                  progress=progress))
+
+    def prefetch_one(self, file_name):
+        try:
+            if image_pixels(file_name) < LARGE_IMAGE_PIXELS:
+                self.cache.get_or_create(self.key(file_name), lambda: load_image(file_name))
+        except OSError:
+            pass
+
+    def prefetch(self, file_names):
+        for file_name in file_names:
+            self.executor.submit(self.prefetch_one, file_name)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,233 @@
+import math
+import os
+import tempfile
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from PIL import Image
+
+from Models.Cancellation import check
+from Models.Effect.Resample import Warp
+from Models.Precision import from_working, get_working_dtype, to_working
+from Models.Registry import effect_job, effect_map
+
+# images from this many pixels on are kept in memory-mapped .npy files and processed tile by tile. Opening an
+# uncompressed file (PPM, BMP, TGA, plain TIFF) reads it in strips: ~185 MB peak process RSS whatever its size.
+# Compressed formats are decoded whole once, their peak RSS is that 8/16 bit image plus ~190 MB (~490 MB at 70 MP)
+LARGE_IMAGE_PIXELS = 64 * 1024 ** 2
+# bytes of source pixels a tile may load at once, the effects allocate a few times more
+TILE_BYTES = 64 * 1024 ** 2
+# source pixels loaded around the inverse-mapped bounding box, for the cubic spline support and prefilter
+WARP_MARGIN = 16
+MIN_TILE = 32
+# raw modes of uncompressed files: (image mode, dtype, channels, channels reversed)
+RAW_MODES = {"L": ("L", np.uint8, 1, False), "RGB": ("RGB", np.uint8, 3, False), "RGBA": ("RGBA", np.uint8, 4, False),
+             "BGR": ("RGB", np.uint8, 3, True), "I;16": ("I;16", "<u2", 1, False)}
+
+Image.MAX_IMAGE_PIXELS = None
+
+
+def is_large(image):
+    return isinstance(image, np.memmap)
+
+
+def new_memmap(shape, directory=None):
+    fd, path = tempfile.mkstemp(suffix=".npy", dir=directory)
+    os.close(fd)
+    return open_memmap(path, mode="w+", dtype=get_working_dtype(), shape=tuple(shape))
+
+
+def finish(output):
+    output.flush()
+    return np.load(output.filename, mmap_mode="r")
+
+
+def row_strips(shape, itemsize, budget=TILE_BYTES):
+    rows = max(1, budget // max(1, int(np.prod(shape[1:])) * itemsize))
+    return [(r, min(r + rows, shape[0])) for r in range(0, shape[0], rows)]
+
+
+def raw_strips(image, file_name):
+    # (shape, read(r0, r1)) reading the rows of an uncompressed image (PPM, BMP, TGA, plain TIFF) straight from its
+    # file, None for the other images
+    if len(image.tile) != 1:
+        return None
+    codec, extents, offset, args = image.tile[0]
+    rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+    if codec != "raw" or tuple(extents) != (0, 0) + image.size or rawmode not in RAW_MODES:
+        return None
+    mode, dtype, channels, reverse = RAW_MODES[rawmode]
+    n, m = image.size
+    row_bytes = n * channels * np.dtype(dtype).itemsize
+    if mode != image.mode or 0 < stride < row_bytes:
+        return None
+    stride = stride or row_bytes
+    shape = (m, n, channels) if channels > 1 else (m, n)
+
+    def read(r0, r1):
+        # bottom-up files store the last row first
+        f0, f1 = (m - r1, m - r0) if orientation < 0 else (r0, r1)
+        with open(file_name, "rb") as f:
+            f.seek(offset + f0 * stride)
+            data = np.frombuffer(f.read((f1 - f0) * stride), dtype=np.uint8).reshape(f1 - f0, stride)
+        pixels = data[:, :row_bytes].view(dtype).reshape((f1 - f0,) + shape[1:])
+        if orientation < 0:
+            pixels = pixels[::-1]
+        return pixels[..., ::-1] if reverse else pixels
+
+    return shape, read
+
+
+def open_large(file_name, directory=None, token=None, progress=None):
+    # the working image as a read-only memory map, converted from the decoded 8/16 bit image strip by strip.
+    # Uncompressed files are read strip by strip too, compressed ones are decoded into memory once first
+    if file_name.lower().endswith(".npy"):
+        source = np.load(file_name, mmap_mode="r")
+        if source.dtype == get_working_dtype():
+            return source
+        return convert_strips(source.shape, lambda r0, r1: source[r0:r1], directory, token, progress)
+
+    with Image.open(file_name) as image:
+        raw = raw_strips(image, file_name)
+        if raw is not None:
+            return convert_strips(*raw, directory, token, progress)
+
+        if image.mode not in ("L", "RGB", "RGBA", "I;16"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        image.load()
+        # np.asarray(image) would copy the whole decoded image once more, strips are cropped out of it instead
+        n, m = image.size
+        shape = (m, n) + ((len(image.getbands()),) if len(image.getbands()) > 1 else ())
+        return convert_strips(shape, lambda r0, r1: np.asarray(image.crop((0, r0, n, r1))), directory, token,
+                              progress)
+
+
+def convert_strips(shape, strip, directory=None, token=None, progress=None):
+    # the working image of strip(r0, r1) in a new .npy file. It is written with file writes, through a memory map
+    # every converted page would stay resident in the process until the end
+    output = new_memmap(shape, directory)
+    path, offset, dtype = output.filename, output.offset, output.dtype
+    del output
+    row_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+    with open(path, "r+b") as f:
+        for r0, r1 in row_strips(shape, dtype.itemsize):
+            check(token)
+            f.seek(offset + r0 * row_bytes)
+            f.write(np.ascontiguousarray(to_working(strip(r0, r1)), dtype=dtype).data)
+            if progress is not None:
+                progress(r1, shape[0])
+    return np.load(path, mmap_mode="r")
+
+
+def save_large(image, file_name, token=None, progress=None):
+    if file_name.lower().endswith(".npy"):
+        output = open_memmap(file_name, mode="w+", dtype=image.dtype, shape=image.shape)
+        for r0, r1 in row_strips(image.shape, image.dtype.itemsize):
+            check(token)
+            output[r0:r1] = image[r0:r1]
+            if progress is not None:
+                progress(r1, image.shape[0])
+        output.flush()
+        return
+
+    # PIL encodes from a whole image, only its 8 bit version is held in memory
+    frame = np.empty(image.shape, dtype=np.uint8)
+    for r0, r1 in row_strips(image.shape, image.dtype.itemsize):
+        check(token)
+        frame[r0:r1] = from_working(image[r0:r1])
+        if progress is not None:
+            progress(r1, image.shape[0])
+    if file_name.lower().endswith((".jpg", ".jpeg")) and frame.ndim == 3 and frame.shape[2] == 4:
+        frame = frame[:, :, :3]
+    Image.fromarray(frame).save(file_name)
+
+
+def effect_halo(effect_name, parameters):
+    # rows around a band a filter reads, None for the effects that need the whole image
+    if effect_name == "median":
+        return int(parameters["size"] // 2)
+    elif effect_name == "mean":
+        return int(parameters["size"])
+    elif effect_name == "gaussian":
+        # covers the truncated kernel and the decay of the recursive filter
+        return int(math.ceil(6 * parameters["radius"])) + 2
+    return None
+
+
+def filter_tiles(source, output, effect_name, parameters, halo, budget=TILE_BYTES, token=None, progress=None):
+    m = source.shape[0]
+    row_bytes = int(np.prod(source.shape[1:])) * source.dtype.itemsize
+    rows = max(1, budget // row_bytes - 2 * halo)
+
+    for r0 in range(0, m, rows):
+        check(token)
+        r1 = min(r0 + rows, m)
+        s0, s1 = max(r0 - halo, 0), min(r1 + halo, m)
+        f, params = effect_job(effect_name, np.array(source[s0:s1]), parameters)
+        output[r0:r1] = f(*params, token=token)[r0 - s0:r1 - s0]
+        if progress is not None:
+            progress(r1, m)
+
+
+def warp_tiles(source, output, build, budget=TILE_BYTES, token=None, progress=None):
+    # every output tile loads only the bounding box of the source points its inverse map reaches,
+    # tiles whose box is over the budget are split until they are MIN_TILE pixels wide
+    m, n = source.shape[:2]
+    pixel_bytes = int(np.prod(source.shape[2:])) * source.dtype.itemsize
+    rows = max(1, budget // (4 * output.shape[1] * pixel_bytes))
+    tiles = [(r0, min(r0 + rows, output.shape[0]), 0, output.shape[1]) for r0 in range(0, output.shape[0], rows)]
+    done = 0
+
+    while tiles:
+        check(token)
+        r0, r1, c0, c1 = tiles.pop(0)
+        coords = build((r0, r1, c0, c1))
+        inside = (coords[0] >= 0) & (coords[0] <= m - 1) & (coords[1] >= 0) & (coords[1] <= n - 1)
+        if not inside.any():
+            output[r0:r1, c0:c1] = 0
+        else:
+            y, x = coords[0][inside], coords[1][inside]
+            y0, y1 = max(int(np.floor(y.min())) - WARP_MARGIN, 0), min(int(np.ceil(y.max())) + WARP_MARGIN + 1, m)
+            x0, x1 = max(int(np.floor(x.min())) - WARP_MARGIN, 0), min(int(np.ceil(x.max())) + WARP_MARGIN + 1, n)
+
+            if (y1 - y0) * (x1 - x0) * pixel_bytes > budget and max(r1 - r0, c1 - c0) > MIN_TILE:
+                if r1 - r0 >= c1 - c0:
+                    half = (r0 + r1) // 2
+                    tiles[:0] = [(r0, half, c0, c1), (half, r1, c0, c1)]
+                else:
+                    half = (c0 + c1) // 2
+                    tiles[:0] = [(r0, r1, c0, half), (r0, r1, half, c1)]
+                continue
+
+            # points outside the image stay outside the box
+            local = coords - np.array([y0, x0], dtype=coords.dtype).reshape(2, 1, 1)
+            local[:, ~inside] = -1
+            tile = Warp(np.array(source[y0:y1, x0:x1]), lambda a, b: local[:, a:b], (r1 - r0, c1 - c0),
+                        token=token, cache=False)
+            output[r0:r1, c0:c1] = np.clip(tile, 0, 1)
+
+        done += (r1 - r0) * (c1 - c0)
+        if progress is not None:
+            progress(done, output.shape[0] * output.shape[1])
+
+
+def Large_Effect(image, effect_name, parameters, directory=None, budget=TILE_BYTES, token=None, progress=None):
+    # applies an effect to a memory-mapped image, the result is written to a new memory-mapped file
+    stage = effect_map(effect_name, image.shape, parameters)
+    if stage is not None:
+        output = new_memmap(tuple(stage[0]) + image.shape[2:], directory)
+        warp_tiles(image, output, stage[1], budget, token, progress)
+        return finish(output)
+
+    halo = effect_halo(effect_name, parameters)
+    if halo is not None:
+        output = new_memmap(image.shape, directory)
+        filter_tiles(image, output, effect_name, parameters, halo, budget, token, progress)
+        return finish(output)
+
+    if image.shape[0] * image.shape[1] >= LARGE_IMAGE_PIXELS:
+        raise ValueError("The %s effect needs the whole image in memory, it is too large for it" % effect_name)
+    f, params = effect_job(effect_name, np.array(image), parameters)
+    output = new_memmap(image.shape, directory)
+    output[...] = f(*params, token=token)
+    return finish(output)
@@ -0,0 +1,84 @@
+import numpy as np
+
+from Models.Cancellation import check
+from Models.Effect.Resample import Warp
+from Models.Precision import clip_unit
+from Models.Registry import DEFAULT_PARAMETERS, effect_job, effect_map
+
+
+def outside(coords, shape):
+    # map_coordinates returns the constant 0 for points outside [0, size - 1]
+    return (coords[0] < 0) | (coords[0] > shape[0] - 1) | (coords[1] < 0) | (coords[1] > shape[1] - 1)
+
+
+def composed_map(maps):
+    # maps are (input shape, output shape, map) of consecutive geometric effects, the last one is applied last.
+    # The output coordinates go through every map back to the source, so the image is resampled only once
+    shape = maps[-1][1]
+
+    def build(r0, r1):
+        coords = maps[-1][2]((r0, r1, 0, shape[1]))
+        invalid = np.zeros(coords.shape[1:], dtype=bool)
+        for _, output_shape, f in reversed(maps[:-1]):
+            # a point the intermediate image did not cover would have been black there
+            invalid |= outside(coords, output_shape)
+            coords = f(coords)
+        if invalid.any():
+            coords = coords.copy()
+            coords[:, invalid] = -1
+        return coords
+
+    return shape, build
+
+
+def Compose(arrF, maps, order=3, token=None):
+    shape, build = composed_map(maps)
+    arrG = Warp(arrF, build, shape, order, token)
+
+    return clip_unit(arrG)
+
+
+class Pipeline:
+    # a chain of effects, runs of geometric effects are fused into a single resample,
+    # filters and the radial blur run as separate stages in between
+    def __init__(self, steps=()):
+        self.steps = []
+        for effect_name, parameters in steps:
+            self.add(effect_name, parameters)
+
+    def add(self, effect_name, parameters):
+        if effect_name not in DEFAULT_PARAMETERS:
+            raise ValueError("Unknown effect: %s" % effect_name)
+        self.steps.append((effect_name, dict(parameters)))
+        return self
+
+    def __len__(self):
+        return len(self.steps)
+
+    def stages(self, shape):
+        # [("warp", [maps]) or ("effect", effect_name, parameters)] for an image of the given shape
+        stages, maps = [], []
+        shape = tuple(shape[:2])
+        for effect_name, parameters in self.steps:
+            stage = effect_map(effect_name, shape, parameters)
+            if stage is None:
+                if maps:
+                    stages.append(("warp", maps))
+                    maps = []
+                stages.append(("effect", effect_name, parameters))
+            else:
+                maps.append((shape, stage[0], stage[1]))
+                shape = stage[0]
+        if maps:
+            stages.append(("warp", maps))
+        return stages
+
+    def __call__(self, image, token=None, order=3):
+        for stage in self.stages(image.shape):
+            check(token)
+            if stage[0] == "warp":
+                image = Compose(image, stage[1], order, token)
+            else:
+                f, params = effect_job(stage[1], image, stage[2], order)
+                image = f(*params, token=token)
+        return image
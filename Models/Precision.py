@@ -0,0 +1,39 @@
+import numpy as np
+
+from Models.Profiler import profiler
+
+working_dtype = np.dtype(np.float32)
+
+
+def set_working_dtype(dtype):
+    global working_dtype
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("The working precision must be float32 or float64, got %s" % dtype)
+    working_dtype = dtype
+
+
+def get_working_dtype():
+    return working_dtype
+
+
+def to_working(image):
+    image = np.asarray(image)
+    if np.issubdtype(image.dtype, np.floating):
+        return image.astype(working_dtype, copy=False)
+
+    scale = 65535.0 if image.dtype == np.uint16 else 255.0
+    arrF = image.astype(working_dtype)
+    arrF /= scale
+    return arrF
+
+
+def clip_unit(arrF):
+    # in place, for arrays the caller has just allocated
+    with profiler.span("clip"):
+        return np.clip(arrF, 0, 1, out=arrF)
+
+
+def from_working(image):
+    # [0, 1] floats -> uint8, rounded
+    return np.round(np.clip(image, 0, 1) * 255).astype(np.uint8)
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Profiler:
+    # opt-in stage timings of the render jobs. Spans on the tile pool threads belong to the job that started last,
+    # their seconds are summed over the threads, so a parallel stage can add up to more than the job's wall time
+    def __init__(self, max_events=200000, max_jobs=1000):
+        self.enabled = False
+        self.memory = False
+        self.events = deque(maxlen=max_events)
+        self.jobs = deque(maxlen=max_jobs)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.active = None
+        self.next_id = 0
+        self.origin = time.perf_counter()
+
+    def enable(self, memory=False):
+        # memory=True also traces the allocations of every span, which slows the renders down considerably
+        self.enabled = True
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.memory = memory
+
+    def disable(self):
+        self.enabled = False
+        if self.memory:
+            tracemalloc.stop()
+            self.memory = False
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+            self.jobs.clear()
+
+    def record(self, name, start, seconds, job, args=None):
+        event = {"name": name, "ts": (start - self.origin) * 1e6, "dur": seconds * 1e6,
+                 "tid": threading.get_ident(), "args": args or {}}
+        with self.lock:
+            self.events.append(event)
+            if job is not None:
+                event["args"]["job"] = job["id"]
+                stage = job["stages"].setdefault(name, [0.0, 0, 0])
+                stage[0] += seconds
+                stage[1] += 1
+                stage[2] += event["args"].get("allocated", 0)
+
+    @contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        job = getattr(self.local, "job", None) or self.active
+        before = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if self.memory:
+                args["allocated"] = tracemalloc.get_traced_memory()[0] - before
+            self.record(name, start, seconds, job, args)
+
+    @contextmanager
+    def job(self, name, image=None, parameters=None, queued=None, **args):
+        # queued: perf_counter() time the job was submitted, the wait until it starts is reported as "queue"
+        if not self.enabled:
+            yield None
+            return
+        start = time.perf_counter()
+        with self.lock:
+            self.next_id += 1
+            job = {"id": self.next_id, "name": name, "stages": OrderedDict(), "args": args,
+                   "shape": list(np.shape(image)) if image is not None else None,
+                   "parameters": dict(parameters) if parameters is not None else None,
+                   "queue": start - queued if queued is not None else 0.0}
+        previous = getattr(self.local, "job", None)
+        self.local.job = self.active = job
+        if self.memory:
+            tracemalloc.reset_peak()
+        try:
+            yield job
+        finally:
+            job["seconds"] = time.perf_counter() - start
+            if self.memory:
+                job["peak"] = tracemalloc.get_traced_memory()[1]
+            self.local.job = previous
+            if self.active is job:
+                self.active = previous
+            with self.lock:
+                self.jobs.append(job)
+            self.record(name, start, job["seconds"], None,
+                        dict(args, job=job["id"], shape=job["shape"], queue=job["queue"]))
+
+    def last_job(self):
+        with self.lock:
+            return self.jobs[-1] if self.jobs else None
+
+    def readout(self, job=None):
+        # one line for the status bar: "swirl 1200x1600 (full): 412 ms, queue 3 ms | coordinates 61 ms, ..."
+        job = job or self.last_job()
+        if job is None:
+            return "Profiler: no jobs yet"
+        shape = "x".join(str(s) for s in job["shape"][:2]) if job["shape"] else ""
+        kind = " (%s)" % job["args"]["kind"] if "kind" in job["args"] else ""
+        stages = ", ".join("%s %.0f ms" % (name, stage[0] * 1e3) for name, stage in job["stages"].items())
+        line = "%s %s%s: %.0f ms, queue %.0f ms | %s" % (job["name"], shape, kind, job["seconds"] * 1e3,
+                                                         job["queue"] * 1e3, stages)
+        if "peak" in job:
+            line += " | peak %.0f MB" % (job["peak"] / 2 ** 20)
+        return line
+
+    def trace(self):
+        # Chrome trace event format, opens in chrome://tracing and Perfetto
+        with self.lock:
+            events = list(self.events)
+            jobs = list(self.jobs)
+        pid = os.getpid()
+        return {"traceEvents": [{"name": e["name"], "ph": "X", "ts": e["ts"], "dur": e["dur"], "pid": pid,
+                                 "tid": e["tid"], "args": e["args"]} for e in events],
+                "otherData": {"jobs": jobs}}
+
+    def dump(self, file_name):
+        with open(file_name, "w") as f:
+            json.dump(self.trace(), f, default=str)
+        return file_name
+
+
+profiler = Profiler()
+if os.environ.get("TTCS_PROFILE"):
+    # TTCS_PROFILE=1 profiles from the start, TTCS_PROFILE=memory also traces allocations
+    profiler.enable(memory=os.environ["TTCS_PROFILE"] == "memory")
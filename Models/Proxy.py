@@ -0,0 +1,35 @@
+import numpy as np
+from PIL import Image
+
+
+def Proxy(arrF, max_shape):
+    m, n = arrF.shape[:2]
+    scale = min(max_shape[0] / m, max_shape[1] / n, 1.0)
+    if scale >= 1.0:
+        return arrF, 1.0
+
+    size = (max(int(round(n * scale)), 1), max(int(round(m * scale)), 1))
+    channels = [arrF] if arrF.ndim == 2 else [arrF[:, :, i] for i in range(arrF.shape[2])]
+    channels = [np.asarray(Image.fromarray(c.astype(np.float32)).resize(size, Image.Resampling.BOX))
+                for c in channels]
+
+    proxy = channels[0] if arrF.ndim == 2 else np.stack(channels, axis=2)
+    return proxy.astype(arrF.dtype), size[1] / m
+
+
+def Proxy_Strips(arrF, max_shape, strip_bytes=64 * 1024 ** 2):
+    # block means of a memory-mapped image, read a strip of rows at a time
+    m, n = arrF.shape[:2]
+    step = int(np.ceil(max(m / max_shape[0], n / max_shape[1], 1.0)))
+    if step == 1:
+        return np.array(arrF), 1.0
+
+    rows, cols = m // step, n // step
+    proxy = np.empty((rows, cols) + arrF.shape[2:], dtype=arrF.dtype)
+    strip = max(1, strip_bytes // (step * arrF[:1].nbytes))
+    for r0 in range(0, rows, strip):
+        r1 = min(r0 + strip, rows)
+        block = np.asarray(arrF[r0 * step:r1 * step, :cols * step])
+        block = block.reshape((r1 - r0, step, cols, step) + arrF.shape[2:])
+        proxy[r0:r1] = block.mean(axis=(1, 3), dtype=np.float64)
+    return proxy, rows / m
@@ -0,0 +1,147 @@
+import copy
+
+from Models.Effect.Cylinder import Cylinder, Cylinder_Map
+from Models.Effect.FishEye_Effect import FishEye_Effect, FishEye_Map, FishEye_Support, delta
+from Models.Effect.RadialBlur_Effect import RadialBlur_Effect
+from Models.Effect.SquareEye_Effect import SquareEye_Effect, SquareEye_Map, SquareEye_Support
+from Models.Effect.Swirl_Effect import Swirl_Effect, Swirl_Map, Swirl_Support
+from Models.Effect.Waves_Effect import Waves_Effect, Waves_Map, waves_shape
+from Models.Filter.Gaussian_Filter import Gaussian_Filter
+from Models.Filter.Mean_Filter import Mean_Filter
+from Models.Filter.Median_Filter import Median_Filter
+
+DEFAULT_PARAMETERS = {"fisheye": {"x": 0, "y": 0, "sigma": 1.0},
+                      "swirl": {"x": 0, "y": 0, "sigma": 0.01, "magnitude": 0},
+                      "waves": {"amplitude": 0.1, "frequency": 0.1, "phase": 0},
+                      "cylinder": {"angle": 0.0},
+                      "radial_blur": {"sigma": 0.1},
+                      "square_eye": {"x": 0, "y": 0, "sigma": 1.0, "p_value": 0.1},
+                      "median": {"size": 3.0},
+                      "gaussian": {"radius": 2.0},
+                      "mean": {"size": 3.0}, }
+
+# parameters measured in pixels of the image, rescaled when rendering on a proxy
+PIXEL_PARAMETERS = {"fisheye": ("x", "y", "sigma"),
+                    "swirl": ("x", "y"),
+                    "waves": ("amplitude", "frequency"),
+                    "cylinder": (),
+                    "radial_blur": ("sigma",),
+                    "square_eye": ("x", "y", "sigma"),
+                    "median": ("size",),
+                    "gaussian": ("radius",),
+                    "mean": ("size",)}
+
+
+def default_parameters():
+    return copy.deepcopy(DEFAULT_PARAMETERS)
+
+
+# window sizes, which stay at least one pixel when they are scaled down (zero still turns the filter off)
+WINDOW_PARAMETERS = {"median": ("size",),
+                     "mean": ("size",)}
+
+
+def scale_parameters(effect_name, parameters, scale):
+    scaled = dict(parameters)
+    for name in PIXEL_PARAMETERS[effect_name]:
+        scaled[name] = parameters[name] * scale
+        if name in WINDOW_PARAMETERS.get(effect_name, ()) and parameters[name] > 0:
+            scaled[name] = max(1.0, scaled[name])
+    return scaled
+
+
+def parameters_key(effect_name, parameters):
+    # 3 and 3.0 (or a spinbox float off in the last bits) describe the same render
+    return (effect_name,) + tuple((name, round(float(parameters[name]), 9)) for name in sorted(parameters))
+
+
+def effect_map(effect_name, shape, parameters):
+    # geometric effects as (output shape, map(window) -> source coordinates), None for the other effects
+    p = parameters
+    shape = tuple(shape[:2])
+
+    if effect_name == "fisheye":
+        return shape, lambda window: FishEye_Map(shape, (p["y"], p["x"]), p["sigma"], window=window)
+
+    elif effect_name == "swirl":
+        return shape, lambda window: Swirl_Map(shape, (p["y"], p["x"]), p["sigma"], p["magnitude"], window)
+
+    elif effect_name == "waves":
+        amplitude = [p["amplitude"], p["amplitude"]]
+        frequency = [p["frequency"], p["frequency"]]
+        phase = [p["phase"], p["phase"]]
+        return waves_shape(shape, amplitude), lambda window: Waves_Map(shape, amplitude, frequency, phase, window)
+
+    elif effect_name == "cylinder":
+        return shape, lambda window: Cylinder_Map(shape, p["angle"], window)
+
+    elif effect_name == "square_eye":
+        return shape, lambda window: SquareEye_Map(shape, (p["y"], p["x"]), p["sigma"], p["p_value"], window)
+
+    return None
+
+
+def effect_support(effect_name, shape, parameters):
+    # (r0, r1, c0, c1) window of the pixels a localized effect moves, None for the effects that may change any pixel
+    p = parameters
+
+    if effect_name == "fisheye":
+        return FishEye_Support(shape, (p["y"], p["x"]), p["sigma"])
+
+    elif effect_name == "swirl":
+        return Swirl_Support(shape, (p["y"], p["x"]), p["sigma"], p["magnitude"])
+
+    elif effect_name == "square_eye":
+        return SquareEye_Support(shape, (p["y"], p["x"]), p["sigma"], p["p_value"])
+
+    return None
+
+
+def dirty_window(effect_name, shape, parameters, previous):
+    # window around every pixel that may differ between the renders of an image with the previous and the new
+    # parameters: the union of both supports, outside them both renders are the image itself. None if unknown
+    windows = [effect_support(effect_name, shape, p) for p in (previous, parameters)]
+    if None in windows:
+        return None
+    windows = [w for w in windows if w[1] > w[0] and w[3] > w[2]]
+    if not windows:
+        return 0, 0, 0, 0
+    r0, r1, c0, c1 = zip(*windows)
+    return min(r0), max(r1), min(c0), max(c1)
+
+
+def effect_job(effect_name, image, parameters, order=3):
+    # order is the interpolation of the geometric effects and the radial blur, the filters ignore it
+    p = parameters
+
+    if effect_name == "fisheye":
+        return FishEye_Effect, (image, (p["y"], p["x"]), p["sigma"], delta, order)
+
+    elif effect_name == "swirl":
+        return Swirl_Effect, (image, (p["y"], p["x"]), p["sigma"], p["magnitude"], order)
+
+    elif effect_name == "waves":
+        amplitude = [p["amplitude"], p["amplitude"]]
+        frequency = [p["frequency"], p["frequency"]]
+        phase = [p["phase"], p["phase"]]
+        return Waves_Effect, (image, amplitude, frequency, phase, order)
+
+    elif effect_name == "cylinder":
+        return Cylinder, (image, p["angle"], order)
+
+    elif effect_name == "radial_blur":
+        return RadialBlur_Effect, (image, p["sigma"], order)
+
+    elif effect_name == "square_eye":
+        return SquareEye_Effect, (image, (p["y"], p["x"]), p["sigma"], p["p_value"], order)
+
+    elif effect_name == "median":
+        return Median_Filter, (image, p["size"])
+
+    elif effect_name == "gaussian":
+        return Gaussian_Filter, (image, p["radius"])
+
+    elif effect_name == "mean":
+        return Mean_Filter, (image, p["size"])
+
+    raise ValueError("Unknown effect: %s" % effect_name)
@@ -0,0 +1,50 @@
+import numpy as np
+
+from Models.Cancellation import check
+from Models.Effect.Resample import Warp
+from Models.Pipeline import Pipeline, composed_map
+from Models.Precision import clip_unit, get_working_dtype
+from Models.Registry import effect_job
+
+# filters share nothing between frames and are slower on the strided planes of a folded stack, they run frame by frame
+FRAME_BY_FRAME = ("median", "gaussian", "mean")
+
+
+def fold(frames):
+    # (N, H, W[, C]) -> contiguous (H, W, N * C), the channels of every frame become planes of one image
+    return np.ascontiguousarray(np.moveaxis(frames, 0, 2).reshape(frames.shape[1:3] + (-1,)))
+
+
+def unfold(arrG, count, channels=()):
+    return np.ascontiguousarray(np.moveaxis(arrG.reshape(arrG.shape[:2] + (count,) + tuple(channels)), 2, 0))
+
+
+def Stack_Warp(frames, build, shape, order=3, token=None):
+    # one coordinate map, and from Warp's plane threshold on one set of interpolation weights, for all frames
+    arrG = Warp(fold(frames), build, shape, order, token, cache=False)
+    return unfold(clip_unit(arrG), len(frames), frames.shape[3:])
+
+
+def Process_Stack(frames, steps, token=None, order=3):
+    # applies an effect chain with the same parameters to every frame of an (N, H, W[, C]) stack
+    frames = np.asarray(frames)
+    for stage in Pipeline(steps).stages(frames.shape[1:3]):
+        check(token)
+        if stage[0] == "warp":
+            shape, build = composed_map(stage[1])
+            frames = Stack_Warp(frames, build, shape, order, token)
+        elif stage[1] in FRAME_BY_FRAME:
+            output = np.empty(frames.shape, dtype=get_working_dtype())
+            for frame, result in zip(frames, output):
+                f, params = effect_job(stage[1], frame, stage[2], order)
+                result[...] = f(*params, token=token)
+            frames = output
+        else:
+            # the radial blur resamples to polar coordinates and back, all frames at once
+            f, params = effect_job(stage[1], fold(frames), stage[2], order)
+            frames = unfold(f(*params, token=token), len(frames), frames.shape[3:])
+    return frames
+
+
+def Stack_Effect(frames, effect_name, parameters, token=None, order=3):
+    return Process_Stack(frames, [(effect_name, parameters)], token, order)
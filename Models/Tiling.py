@@ -0,0 +1,83 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Models.Cancellation import check
+
+# a band never holds more output pixels than this, so cancellation is noticed quickly
+BAND_PIXELS = 1 << 20
+MIN_BAND_PIXELS = 1 << 14
+
+workers = os.cpu_count() or 1
+executor = None
+executor_lock = threading.Lock()
+local = threading.local()
+
+
+def mark_pool_thread():
+    local.in_pool = True
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile",
+                                          initializer=mark_pool_thread)
+        return executor
+
+
+def set_workers(count):
+    global workers, executor
+    with executor_lock:
+        workers = max(1, int(count))
+        if executor is not None:
+            executor.shutdown(wait=False)
+            executor = None
+
+
+def row_bands(rows, row_pixels=1, min_rows=1):
+    total = rows * row_pixels
+    count = max(workers * 2, -(-total // BAND_PIXELS))
+    count = min(count, max(1, total // MIN_BAND_PIXELS), max(1, rows // max(1, min_rows)))
+    edges = np.linspace(0, rows, count + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def run_tiles(fn, tiles, token=None):
+    def task(tile):
+        check(token)
+        return fn(tile)
+
+    # tiles submitted from a pool thread run inline, waiting on the pool from inside it could deadlock
+    if len(tiles) <= 1 or workers <= 1 or getattr(local, "in_pool", False):
+        return [task(tile) for tile in tiles]
+
+    futures = [get_executor().submit(task, tile) for tile in tiles]
+    try:
+        return [future.result() for future in futures]
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def channels_of(arr):
+    return [arr] if arr.ndim == 2 else [arr[:, :, i] for i in range(arr.shape[2])]
+
+
+def Filter_Bands(fn, arrF, halo, dtype=None, token=None):
+    m, n = arrF.shape[:2]
+    arrG = np.empty(arrF.shape, dtype=arrF.dtype if dtype is None else dtype)
+    sources, outputs = channels_of(arrF), channels_of(arrG)
+
+    def band(tile):
+        i, (r0, r1) = tile
+        s0, s1 = max(r0 - halo, 0), min(r1 + halo, m)
+        outputs[i][r0:r1] = fn(sources[i][s0:s1])[r0 - s0:r1 - s0]
+
+    bands = row_bands(m, n, min_rows=2 * halo)
+    run_tiles(band, [(i, b) for i in range(len(sources)) for b in bands], token)
+    return arrG
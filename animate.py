@@ -0,0 +1,35 @@
+import argparse
+
+from Models.Animation import Export_Animation, parse_sweep, sweep_values
+from Models.Batch import effect_argument, read_image
+from Models.Precision import set_working_dtype
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render an effect over a parameter sweep into a GIF, a video "
+                                                 "or a frame sequence.")
+    parser.add_argument("input", help="image file")
+    parser.add_argument("-o", "--output", required=True,
+                        help="output.gif, output.mp4 (needs imageio-ffmpeg), frames/name_%%04d.png or a directory")
+    parser.add_argument("-e", "--effect", required=True, type=effect_argument,
+                        help="effect and fixed parameters, e.g. swirl:x=120,y=80,sigma=0.3")
+    parser.add_argument("-s", "--sweep", required=True, help="swept parameter and range, e.g. magnitude=0:10")
+    parser.add_argument("-n", "--frames", type=int, default=30)
+    parser.add_argument("--fps", type=float, default=20)
+    parser.add_argument("--lookahead", type=int, default=None,
+                        help="maximum number of frames rendered ahead of the encoder")
+    parser.add_argument("--precision", default="float32", choices=["float32", "float64"],
+                        help="working precision of the pixel pipeline")
+    args = parser.parse_args()
+    set_working_dtype(args.precision)
+
+    effect_name, parameters = args.effect
+    try:
+        parameter_name, start, stop = parse_sweep(args.sweep, effect_name)
+    except ValueError as e:
+        parser.error(str(e))
+
+    values = sweep_values(start, stop, args.frames)
+    count = Export_Animation(read_image(args.input), effect_name, parameters, parameter_name, values, args.output,
+                             args.fps, args.lookahead,
+                             progress=lambda i, total: print("\rframe %d/%d" % (i, total), end="", flush=True))
+    print("\n%d frames written to %s" % (count, args.output))
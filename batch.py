@@ -0,0 +1,38 @@
+import argparse
+import sys
+
+from Models.Batch import effect_argument, find_images, run_batch
+from Models.Filter.Median_Filter import MEDIAN_CROSSOVER, MEDIAN_METHODS, set_median_method
+from Models.Precision import set_working_dtype
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply an effect chain to many images without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="directory the processed images are written to")
+    parser.add_argument("-e", "--effect", action="append", required=True, type=effect_argument,
+                        help="effect and parameters, e.g. swirl:x=120,y=80,magnitude=4 (repeat to chain)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--in-flight", type=int, default=None,
+                        help="maximum number of images held in memory at once (default 2 per job)")
+    parser.add_argument("--format", default=None, help="output file extension, e.g. png (default: keep)")
+    parser.add_argument("--precision", default="float32", choices=["float32", "float64"],
+                        help="working precision of the pixel pipeline")
+    parser.add_argument("--median", default="auto", choices=MEDIAN_METHODS,
+                        help="median engine: exact, histogram (8 bit quantized, fast for large windows) or auto "
+                             "(histogram from size %d on 8 bit input only)" % MEDIAN_CROSSOVER)
+    parser.add_argument("--large", action="store_true",
+                        help="keep the images in memory-mapped files and process them tile by tile")
+    args = parser.parse_args()
+    set_working_dtype(args.precision)
+    set_median_method(args.median)
+
+    files = find_images(args.inputs)
+    if not files:
+        print("No images found")
+        sys.exit(1)
+
+    try:
+        run_batch(files, args.output, args.effect, args.jobs, args.in_flight, args.format, large=args.large)
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from threading import Event
+
+import numpy as np
+
+from Models.Effect.Resample import INTERPOLATION
+from Models.Filter.Median_Filter import Median_Filter
+from Models.Precision import get_working_dtype, set_working_dtype
+from Models.Profiler import profiler
+from Models.Registry import DEFAULT_PARAMETERS, default_parameters, effect_job
+from Models.Stack import Stack_Effect
+
+SIZES = {"512": (512, 512), "1k": (1024, 1024), "2k": (2048, 2048), "4k": (2160, 3840), "8k": (4320, 7680)}
+CHANNELS = {"gray": 1, "rgb": 3, "rgba": 4}
+
+
+def parse_size(text):
+    if text.lower() in SIZES:
+        return text.lower(), SIZES[text.lower()]
+    width, _, height = text.lower().partition("x")
+    return text, (int(height or width), int(width))
+
+
+def synthetic_image(shape, channels, seed=0):
+    rng = np.random.default_rng(seed)
+    m, n = shape
+    # smooth gradients plus noise, so filters and warps see realistic structure
+    v, u = np.meshgrid(np.linspace(0, 1, m), np.linspace(0, 1, n), indexing="ij")
+    planes = [0.5 + 0.25 * np.sin(2 * np.pi * (3 + i) * u) * np.cos(2 * np.pi * (2 + i) * v) for i in range(channels)]
+    image = np.stack(planes, axis=2) + 0.1 * rng.random((m, n, channels))
+    image = np.clip(image, 0, 1).astype(get_working_dtype())
+    return image[:, :, 0] if channels == 1 else image
+
+
+def benchmark_parameters(name, shape):
+    m, n = shape
+    p = default_parameters()[name]
+    if "x" in p:
+        p["x"], p["y"] = n / 2, m / 2
+    p.update({"fisheye": {"sigma": min(m, n) / 4},
+              "swirl": {"sigma": 0.3, "magnitude": 4},
+              "waves": {"amplitude": 8, "frequency": 20, "phase": 0.5},
+              "cylinder": {"angle": 45},
+              "radial_blur": {"sigma": 3},
+              "square_eye": {"sigma": min(m, n) / 8, "p_value": 1.5},
+              "median": {"size": 5},
+              "gaussian": {"radius": 3},
+              "mean": {"size": 7}}[name])
+    return p
+
+
+def measure(fn, repeats):
+    start = time.perf_counter()
+    fn()
+    cold = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"cold": cold, "seconds": statistics.median(times), "min": min(times), "peak_mb": peak / 2 ** 20}
+
+
+def record(kind, name, size_name, shape, channels, timing):
+    megapixels = shape[0] * shape[1] / 1e6
+    return {"kind": kind, "name": name, "size": size_name, "shape": list(shape), "channels": channels,
+            "megapixels": megapixels, "mp_per_s": megapixels / max(timing["seconds"], 1e-12), **timing}
+
+
+class WorkerBench:
+    def __init__(self):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PySide6.QtCore import QThreadPool, Qt
+        from PySide6.QtGui import QGuiApplication
+        from Controllers.Display import to_display, to_pixmap
+        from Controllers.Worker import Worker
+
+        self.app = QGuiApplication.instance() or QGuiApplication(sys.argv[:1])
+        self.to_display = to_display
+        self.to_pixmap = to_pixmap
+        self.done = Event()
+        self.worker = Worker()
+        self.worker.signals.processed.connect(lambda *processed: self.done.set(), Qt.DirectConnection)
+        self.threadpool = QThreadPool()
+        self.threadpool.start(self.worker)
+
+    def dispatch(self, f, params, key=None):
+        self.done.clear()
+        self.worker.process(f, params, key=key)
+        self.done.wait()
+
+    def stop(self):
+        self.worker.terminate = True
+        self.threadpool.waitForDone()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(effects, sizes, channel_names, repeats, qt, order=3, report=print):
+    results = []
+    bench = WorkerBench() if qt else None
+    try:
+        for size_name, shape in sizes:
+            for channel_name in channel_names:
+                image = synthetic_image(shape, CHANNELS[channel_name])
+                for name in effects:
+                    f, params = effect_job(name, image, benchmark_parameters(name, shape), order)
+                    results.append(record("effect", name, size_name, shape, channel_name,
+                                          measure(lambda: f(*params), repeats)))
+                    report(format_result(results[-1]))
+                    if bench is not None:
+                        results.append(record("worker", name, size_name, shape, channel_name,
+                                              measure(lambda: bench.dispatch(f, params), repeats)))
+                        report(format_result(results[-1]))
+                        # the first call fills the result cache, the timed ones are served from it
+                        key = (size_name, channel_name, name)
+                        results.append(record("cached", name, size_name, shape, channel_name,
+                                              measure(lambda: bench.dispatch(f, params, key), repeats)))
+                        report(format_result(results[-1]))
+                if bench is not None:
+                    results.append(record("display", "to_display", size_name, shape, channel_name,
+                                          measure(lambda: bench.to_display(image), repeats)))
+                    report(format_result(results[-1]))
+                    results.append(record("pixmap", "to_pixmap", size_name, shape, channel_name,
+                                          measure(lambda: bench.to_pixmap(image), repeats)))
+                    report(format_result(results[-1]))
+    finally:
+        if bench is not None:
+            bench.stop()
+    return results
+
+
+def median_crossover(sizes, channel_names, windows, repeats, report=print):
+    # times both median engines over a range of window sizes, on 8 bit quantized input where they agree
+    results = []
+    for size_name, shape in sizes:
+        for channel_name in channel_names:
+            image = np.round(synthetic_image(shape, CHANNELS[channel_name]) * 255) / 255
+            image = image.astype(get_working_dtype())
+            crossover = None
+            for window in windows:
+                timings = {}
+                for method in ("exact", "histogram"):
+                    results.append(record("median", "%s-%d" % (method, window), size_name, shape, channel_name,
+                                          measure(lambda: Median_Filter(image, window, method), repeats)))
+                    report(format_result(results[-1]))
+                    timings[method] = results[-1]["seconds"]
+                if crossover is None and timings["histogram"] < timings["exact"]:
+                    crossover = window
+            report("median crossover %s %s: %s" % (size_name, channel_name,
+                                                   "none" if crossover is None else "size %d" % crossover))
+    return results
+
+
+def stack_throughput(effects, sizes, channel_names, count, repeats, report=print):
+    # the same effect on count frames, one call per frame against one call for the whole stack
+    results = []
+    for size_name, shape in sizes:
+        for channel_name in channel_names:
+            frames = np.stack([synthetic_image(shape, CHANNELS[channel_name], seed) for seed in range(count)])
+            for name in effects:
+                parameters = benchmark_parameters(name, shape)
+
+                def per_frame():
+                    for frame in frames:
+                        f, params = effect_job(name, frame, parameters)
+                        f(*params)
+
+                results.append(record("frames", "%s-%d" % (name, count), size_name, shape, channel_name,
+                                      measure(per_frame, repeats)))
+                report(format_result(results[-1]))
+                results.append(record("stack", "%s-%d" % (name, count), size_name, shape, channel_name,
+                                      measure(lambda: Stack_Effect(frames, name, parameters), repeats)))
+                report(format_result(results[-1]))
+    return results
+
+
+def format_result(r):
+    return "%-7s %-12s %-5s %-5s %8.4fs (cold %8.4fs) %9.2f MP/s %9.1f MB" % (
+        r["kind"], r["name"], r["size"], r["channels"], r["seconds"], r["cold"], r["mp_per_s"], r["peak_mb"])
+
+
+def compare(base_file, new_file, report=print):
+    def key(r):
+        return r["kind"], r["name"], r["size"], r["channels"]
+
+    with open(base_file) as f:
+        base = {key(r): r for r in json.load(f)["results"]}
+    with open(new_file) as f:
+        new = json.load(f)["results"]
+
+    for r in new:
+        if key(r) in base:
+            b = base[key(r)]
+            report("%-7s %-12s %-5s %-5s %8.4fs -> %8.4fs  x%5.2f   %9.1f -> %9.1f MB" % (
+                *key(r), b["seconds"], r["seconds"], b["seconds"] / max(r["seconds"], 1e-12), b["peak_mb"],
+                r["peak_mb"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the effects, the Worker and the display conversion.")
+    parser.add_argument("--effects", default=",".join(DEFAULT_PARAMETERS),
+                        help="comma separated effect names (default: all)")
+    parser.add_argument("--sizes", default="512,1k,2k",
+                        help="comma separated sizes: %s or WxH (default: 512,1k,2k)" % ", ".join(SIZES))
+    parser.add_argument("--channels", default="gray,rgb,rgba", help="comma separated: gray, rgb, rgba")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--precision", default="float32", choices=["float32", "float64"],
+                        help="working precision of the pixel pipeline")
+    parser.add_argument("--median-crossover", metavar="SIZES",
+                        help="comma separated median window sizes to time both median engines on, e.g. 3,5,7,9,15")
+    parser.add_argument("--interpolation", default="cubic", choices=list(INTERPOLATION),
+                        help="interpolation of the geometric effects and the radial blur")
+    parser.add_argument("--stack", type=int, metavar="FRAMES",
+                        help="time the effects on a stack of this many frames, frame by frame and as one batch")
+    parser.add_argument("--no-qt", action="store_true", help="skip the Worker dispatch and QPixmap benchmarks")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file the results are saved to")
+    parser.add_argument("--profile", metavar="TRACE",
+                        help="record the stage timings of every call and save them as a Chrome trace file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two saved result files")
+    args = parser.parse_args()
+
+    set_working_dtype(args.precision)
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    if args.profile:
+        profiler.enable()
+
+    if args.median_crossover:
+        results = median_crossover([parse_size(s) for s in args.sizes.split(",")], args.channels.split(","),
+                                   [int(s) for s in args.median_crossover.split(",")], args.repeats)
+    elif args.stack:
+        results = stack_throughput(args.effects.split(","), [parse_size(s) for s in args.sizes.split(",")],
+                                   args.channels.split(","), args.stack, args.repeats)
+    else:
+        results = run(args.effects.split(","), [parse_size(s) for s in args.sizes.split(",")],
+                      args.channels.split(","), args.repeats, not args.no_qt, INTERPOLATION[args.interpolation])
+
+    meta = {"commit": git_commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "precision": args.precision, "interpolation": args.interpolation,
+            "platform": platform.platform(), "cpu_count": os.cpu_count()}
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    print("Saved %d results to %s" % (len(results), args.output))
+    if args.profile:
+        print("Saved %d trace events to %s" % (len(profiler.events), profiler.dump(args.profile)))
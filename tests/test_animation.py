@@ -0,0 +1,13 @@
+import numpy as np
+
+from Models.Animation import frame_shape, render_frame, render_frames
+
+
+def test_render_frames_in_order():
+    image = np.random.default_rng(0).random((40, 50, 3)).astype(np.float32)
+    parameters = {"x": 25, "y": 20, "sigma": 0.3, "magnitude": 0}
+    values = [0.0, 1.0, 2.0, 3.0, 4.0]
+    shape = frame_shape("swirl", image.shape, parameters, "magnitude", values)
+    frames = list(render_frames(image, "swirl", parameters, "magnitude", values))
+    for value, frame in zip(values, frames):
+        np.testing.assert_array_equal(frame, render_frame(image, "swirl", parameters, "magnitude", value, shape))
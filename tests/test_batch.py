@@ -0,0 +1,32 @@
+import argparse
+import os
+
+import pytest
+
+from Models.Batch import effect_argument, output_names, parse_effect
+
+
+def test_parse_effect_names_the_unknown_parameter():
+    with pytest.raises(ValueError, match="sigmaa"):
+        parse_effect("fisheye:sigmaa=3")
+
+
+def test_effect_argument_keeps_the_message_for_argparse():
+    with pytest.raises(argparse.ArgumentTypeError, match="swirll"):
+        effect_argument("swirll")
+
+
+def test_output_names(tmp_path):
+    files = [str(tmp_path / "a" / "x.png"), str(tmp_path / "b" / "y.png")]
+    assert output_names(files, str(tmp_path / "out"), "jpg") == [os.path.join(str(tmp_path / "out"), "x.jpg"),
+                                                                  os.path.join(str(tmp_path / "out"), "y.jpg")]
+
+
+def test_output_names_refuse_to_overwrite_an_input(tmp_path):
+    with pytest.raises(ValueError, match="overwrite"):
+        output_names([str(tmp_path / "x.png")], str(tmp_path))
+
+
+def test_output_names_refuse_duplicates(tmp_path):
+    with pytest.raises(ValueError, match="both"):
+        output_names([str(tmp_path / "a" / "x.png"), str(tmp_path / "b" / "x.png")], str(tmp_path / "out"))
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from Models.Filter.Gaussian_Filter import Gaussian_Filter
+
+
+@pytest.mark.parametrize("radius", [6, 50, 99.99])
+def test_recursive_keeps_flat_areas_flat(radius):
+    arrF = np.full((120, 160, 3), 0.5, dtype=np.float32)
+    assert np.abs(Gaussian_Filter(arrF, radius, "recursive") - 0.5).max() < 1e-6
+
+
+def test_recursive_matches_the_sampled_kernel():
+    arrF = np.random.default_rng(0).random((120, 160)).astype(np.float32)
+    reference = gaussian_filter(arrF.astype(np.float64), 20, mode="nearest")
+    assert np.abs(Gaussian_Filter(arrF, 20, "recursive") - reference).max() < 2e-3
+
+
+@pytest.mark.parametrize("shape", [(2, 50), (50, 1), (1, 1, 3)])
+def test_recursive_on_images_thinner_than_three_pixels(shape):
+    arrF = np.random.default_rng(1).random(shape).astype(np.float32)
+    assert np.allclose(Gaussian_Filter(arrF, 10, "recursive"), Gaussian_Filter(arrF, 10, "exact"), atol=5e-3)
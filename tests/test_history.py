@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from Models.Cancellation import CancelToken, Cancelled
+from Models.History import History
+
+
+def brighten(image, amount, token=None):
+    return np.clip(image + amount, 0, 1)
+
+
+def make_history():
+    history = History(keyframe_interval=4)
+    image = np.full((8, 8), 0.25, dtype=np.float32)
+    history.reset("original", image)
+    states = [image]
+    for amount in (0.1, 0.2, 0.05):
+        image = brighten(image, amount)
+        history.push("brighten", image, (brighten, (amount,)))
+        states.append(image)
+    return history, states
+
+
+def test_restore_replays_without_moving():
+    history, states = make_history()
+    image = history.restore(2)
+    np.testing.assert_allclose(image, states[2], atol=1e-4)
+    assert history.index == 3
+    history.move(2, image)
+    assert history.restore(2) is image
+
+
+def test_restore_can_be_cancelled():
+    history, _ = make_history()
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(Cancelled):
+        history.restore(2, token)
+
+
+def test_undo_redo():
+    history, states = make_history()
+    np.testing.assert_allclose(history.undo(), states[2], atol=1e-4)
+    np.testing.assert_allclose(history.redo(), states[3], atol=1e-4)
+    assert not history.can_redo()
@@ -0,0 +1,23 @@
+import numpy as np
+from PIL import Image
+
+from Models.ImageIO import nearest_first, neighbours
+
+
+def make_folder(tmp_path, names):
+    for name in names:
+        Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8)).save(tmp_path / name)
+    return [str(tmp_path / name) for name in names]
+
+
+def test_neighbours_at_the_folder_edges(tmp_path):
+    a, b, c = make_folder(tmp_path, ["a.png", "b.png", "c.png"])
+    assert neighbours(a) == ([b], [])
+    assert neighbours(b) == ([c], [a])
+    assert neighbours(c) == ([], [b])
+
+
+def test_nearest_first(tmp_path):
+    a, b, c, d = make_folder(tmp_path, ["a.png", "b.png", "c.png", "d.png"])
+    assert nearest_first(*neighbours(a, count=2)) == [b, c]
+    assert nearest_first(*neighbours(c, count=2)) == [d, b, a]
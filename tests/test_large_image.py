@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from Models.ImageIO import decode
+from Models.LargeImage import open_large, raw_strips
+from Models.Precision import to_working
+
+rng = np.random.default_rng(0)
+RGB = rng.integers(0, 255, (37, 53, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("name, pixels, raw", [("a.ppm", RGB, True), ("a.bmp", RGB, True), ("a.tga", RGB, True),
+                                               ("a.tif", RGB, True), ("g.bmp", RGB[..., 0], True),
+                                               ("odd.bmp", RGB[:, :51], True),
+                                               ("a16.tif", rng.integers(0, 65535, (37, 53), dtype=np.uint16), True),
+                                               ("a.png", RGB, False), ("a.jpg", RGB, False)])
+def test_open_large_matches_decode(tmp_path, name, pixels, raw):
+    file_name = str(tmp_path / name)
+    Image.fromarray(pixels).save(file_name)
+    with Image.open(file_name) as image:
+        assert (raw_strips(image, file_name) is not None) == raw
+    image = open_large(file_name, str(tmp_path))
+    np.testing.assert_array_equal(image, to_working(decode(file_name)))
+    # the map has to be gone before the directory is removed on Windows
+    del image
@@ -0,0 +1,23 @@
+import numpy as np
+from scipy.ndimage import median_filter
+
+from Models.Filter.Median_Filter import Median_Filter, is_quantized
+from Models.Precision import to_working
+
+
+def test_auto_matches_scipy_on_unquantized_input():
+    arrF = np.random.default_rng(0).random((40, 50)).astype(np.float32)
+    assert not is_quantized(arrF)
+    assert np.array_equal(Median_Filter(arrF, 9), median_filter(arrF, 9))
+
+
+def test_auto_takes_the_histogram_engine_on_8_bit_input():
+    arrF = to_working(np.random.default_rng(1).integers(0, 256, (40, 50), dtype=np.uint8))
+    assert is_quantized(arrF)
+    assert np.array_equal(Median_Filter(arrF, 9), median_filter(arrF, 9))
+    assert np.array_equal(Median_Filter(arrF, 9, "histogram"), Median_Filter(arrF, 9, "exact"))
+
+
+def test_explicit_histogram_quantizes():
+    arrF = np.full((20, 20), 0.3, dtype=np.float32)
+    assert np.allclose(Median_Filter(arrF, 9, "histogram"), round(0.3 * 255) / 255)
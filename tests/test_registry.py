@@ -0,0 +1,19 @@
+import numpy as np
+
+from Models.Filter.Mean_Filter import Mean_Filter
+from Models.Registry import effect_job, scale_parameters
+
+
+def test_scaled_window_sizes_stay_at_least_one_pixel():
+    assert scale_parameters("mean", {"size": 3.0}, 0.2) == {"size": 1.0}
+    assert scale_parameters("median", {"size": 3.0}, 0.2) == {"size": 1.0}
+    assert scale_parameters("median", {"size": 0.0}, 0.2) == {"size": 0.0}
+    assert scale_parameters("gaussian", {"radius": 2.0}, 0.2) == {"radius": 0.4}
+
+
+def test_proxy_filters_render_with_scaled_sizes():
+    arrF = np.random.default_rng(0).random((30, 40, 3)).astype(np.float32)
+    for name in ("mean", "median"):
+        f, params = effect_job(name, arrF, scale_parameters(name, {"size": 3.0}, 0.2))
+        assert f(*params).shape == arrF.shape
+    assert Mean_Filter(arrF, 0.6) is arrF
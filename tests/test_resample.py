@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import scipy.ndimage as img
+
+from Models.Effect.Resample import Warp_Rows
+from Models.Effect.Waves_Effect import Waves_Effect, Waves_Map, waves_shape, waves_tables
+
+
+def reference(arrF, matX, order):
+    # map_coordinates channel by channel, the way Warp resamples
+    planes = [arrF] if arrF.ndim == 2 else [arrF[..., i] for i in range(arrF.shape[2])]
+    out = [img.map_coordinates(p.astype(np.float64), matX.astype(np.float64), order=order, mode="constant")
+           for p in planes]
+    return out[0] if arrF.ndim == 2 else np.stack(out, axis=2)
+
+
+@pytest.mark.parametrize("order", [0, 1, 2, 3, 4, 5])
+@pytest.mark.parametrize("shape", [(37, 53), (41, 29, 3)])
+def test_warp_rows_matches_map_coordinates(order, shape):
+    arrF = np.random.default_rng(order).random(shape).astype(np.float32)
+    out_shape = (shape[0] + 6, shape[1] + 6)
+    v = np.arange(out_shape[0])
+    # fractional rows and shifts, some of them outside the image
+    y = (v - 3 + 0.37 * np.sin(v / 2.0)).astype(np.float32)
+    x0 = (-3 + 2.6 * np.sin(v / 3.0)).astype(np.float32)
+    matX = np.stack(np.broadcast_arrays(y[:, None], np.arange(out_shape[1])[None] + x0[:, None]))
+
+    if order not in (0, 1, 3):
+        with pytest.raises(ValueError):
+            Warp_Rows(arrF, y, x0, out_shape, order)
+        return
+    np.testing.assert_allclose(Warp_Rows(arrF, y, x0, out_shape, order), reference(arrF, matX, order), atol=1e-4)
+
+
+@pytest.mark.parametrize("order", [0, 1, 2, 3, 4, 5])
+def test_waves_every_order(order):
+    arrF = np.random.default_rng(0).random((40, 50, 3)).astype(np.float32)
+    ampl, fre, phase = (3, 3), (5, 5), (0, 0)
+    matX = Waves_Map(arrF.shape, ampl, fre, phase)
+    expected = np.clip(reference(arrF, matX, order), 0, 1)
+    arrG = Waves_Effect(arrF, ampl, fre, phase, order=order)
+    assert arrG.shape[:2] == waves_shape(arrF.shape, ampl)
+    # nearest may round a sample exactly halfway the other way, the map is in the working precision
+    assert np.mean(np.abs(arrG - expected) > 1e-4) < 1e-3
+
+
+def test_waves_tables_are_cached():
+    shape = (30, 40)
+    assert waves_tables(shape, (2, 2), (4, 4), (1, 1))[0] is waves_tables(shape, (2, 2), (4, 4), (1, 1))[0]
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from Models.Effect.Resample import Warp
+from Models.Effect.SquareEye_Effect import SquareEye_Effect, SquareEye_Map, SquareEye_Support
+
+
+@pytest.mark.parametrize("center, sigma, p", [((100, 140), 10, 0.1), ((100, 140), 1, 0.1), ((60, 50), 20, 0.5),
+                                               ((0, 0), 15, 3)])
+def test_square_eye_window_matches_the_full_warp(center, sigma, p):
+    arrF = np.random.default_rng(0).random((200, 300)).astype(np.float32)
+    full = Warp(arrF, lambda r0, r1: SquareEye_Map(arrF.shape, center, sigma, p, (r0, r1, 0, 300)), order=3)
+    assert np.abs(SquareEye_Effect(arrF, center, sigma, p) - np.clip(full, 0, 1)).max() < 2e-3
+
+
+def test_square_eye_support_of_small_p_covers_the_bump():
+    r0, r1, c0, c1 = SquareEye_Support((4000, 6000), (2000, 3000), 20, 0.1)
+    assert r0 < 2000 - 20 and r1 > 2000 + 20 and c0 < 3000 - 20 and c1 > 3000 + 20